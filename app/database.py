@@ -1,3 +1,9 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
 from sqlalchemy import create_engine, event
 from sqlalchemy.orm import declarative_base, sessionmaker
 from sqlalchemy.pool import StaticPool
@@ -49,4 +55,98 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# Отдельный поток для работы с SQLite из async-кода: запросы не блокируют
+# event loop, а один поток сохраняет порядок транзакций. Поток ровно один:
+# у SQLite один писатель, а StaticPool держит одно общее соединение.
+db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="quizbattle-db")
+
+
+class DbStats:
+    """Время SQL-запросов, выполненных прямо в event loop, и загрузка потока БД."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.loop_statements = 0
+        self.loop_total = 0.0
+        self.loop_max = 0.0
+        self.calls = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+        self.run_max = 0.0
+
+    def on_loop(self, elapsed: float) -> None:
+        with self._lock:
+            self.loop_statements += 1
+            self.loop_total += elapsed
+            self.loop_max = max(self.loop_max, elapsed)
+
+    def executor_call(self, waited: float, elapsed: float) -> None:
+        with self._lock:
+            self.calls += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            self.run_total += elapsed
+            self.run_max = max(self.run_max, elapsed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "loop_statements": self.loop_statements,
+                "loop_blocked_ms": round(self.loop_total * 1000, 1),
+                "loop_blocked_ms_max": round(self.loop_max * 1000, 2),
+                "executor_calls": self.calls,
+                "executor_wait_ms_avg": round(self.wait_total / self.calls * 1000, 2) if self.calls else 0.0,
+                "executor_wait_ms_max": round(self.wait_max * 1000, 2),
+                "executor_run_ms_avg": round(self.run_total / self.calls * 1000, 2) if self.calls else 0.0,
+                "executor_run_ms_max": round(self.run_max * 1000, 2),
+            }
+
+
+db_stats = DbStats()
+_statement_started = threading.local()
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _statement_started.value = time.perf_counter()
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Запрос из потока event loop блокирует все комнаты — считаем его отдельно.
+    if _on_event_loop():
+        db_stats.on_loop(time.perf_counter() - _statement_started.value)
+
+
+def _call_with_session(fn: Callable[..., Any], args: tuple, submitted: float) -> Any:
+    started = time.perf_counter()
+    # Объекты из fn используются в event loop после закрытия сессии — не сбрасываем их при commit.
+    db = SessionLocal(expire_on_commit=False)
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+        db_stats.executor_call(started - submitted, time.perf_counter() - started)
+
+
+async def run_db(fn: Callable[..., Any], *args: Any) -> Any:
+    """
+    Выполняет fn(db, *args) в потоке БД с собственной короткой сессией.
+
+    Возвращает:
+        Any: Результат fn
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, _call_with_session, fn, args, time.perf_counter())
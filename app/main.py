@@ -14,15 +14,22 @@ from fastapi.responses import Response
 from fastapi.staticfiles import StaticFiles
 from app.routers import router as main_router
 from app.database import Base, engine
+from app.migrations import upgrade_indexes
+from app.services.game_service import game_service
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
-    Создает таблицы в базе данных при запуске приложения.
+    Создает таблицы в базе данных, обновляет индексы и восстанавливает идущие игры при запуске;
+    при остановке сохраняет их снимок.
     """
     Base.metadata.create_all(bind=engine)
+    for change in upgrade_indexes(engine):
+        print(f"🗂️ Миграция индексов: {change}")
+    await game_service.start()
     yield
+    await game_service.stop()
 
 
 app = FastAPI(
@@ -0,0 +1,48 @@
+"""
+Обновление индексов в существующих базах quizbattle.db.
+
+create_all создает только отсутствующие таблицы вместе с их индексами;
+у уже созданных таблиц индексы не меняются. upgrade_indexes приводит
+индексы к описанию в моделях: удаляет устаревшие (в том числе прежний
+глобально уникальный индекс PIN) и создает недостающие. Все операции
+идемпотентны и выполняются одной транзакцией.
+"""
+
+from sqlalchemy.engine import Connection, Engine
+
+from app import models  # noqa: F401 — таблицы регистрируются в Base.metadata при импорте
+from app.database import Base
+
+# Индексы прежних версий схемы, которые заменены составными.
+OBSOLETE_INDEXES = ("ix_players_game_id", "ix_questions_game_id", "ix_questions_team")
+
+
+def _index_list(conn: Connection, table: str) -> dict[str, bool]:
+    """Имя индекса -> уникальный ли он (PRAGMA index_list)."""
+    return {row[1]: bool(row[2]) for row in conn.exec_driver_sql(f"PRAGMA index_list({table})")}
+
+
+def upgrade_indexes(engine: Engine) -> list[str]:
+    """Возвращает список выполненных изменений (пустой, если база уже актуальна)."""
+    changes: list[str] = []
+    with engine.begin() as conn:
+        existing = {table: _index_list(conn, table) for table in Base.metadata.tables}
+        # Раньше PIN был уникален среди всех игр, теперь — только среди незавершенных.
+        if existing.get("games", {}).get("ix_games_pin"):
+            conn.exec_driver_sql("DROP INDEX ix_games_pin")
+            del existing["games"]["ix_games_pin"]
+            changes.append("drop unique ix_games_pin")
+        for indexes in existing.values():
+            for name in OBSOLETE_INDEXES:
+                if name in indexes:
+                    conn.exec_driver_sql(f"DROP INDEX {name}")
+                    changes.append(f"drop {name}")
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name not in existing.get(table.name, {}):
+                    index.create(conn)
+                    changes.append(f"create {index.name}")
+        if changes:
+            # Свежая статистика для планировщика после смены индексов.
+            conn.exec_driver_sql("ANALYZE")
+    return changes
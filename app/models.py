@@ -38,7 +38,7 @@ class Game(Base):
 
     Атрибуты:
         id (int): Уникальный идентификатор игры
-        pin (str): Уникальный 6-символьный код для подключения к игре
+        pin (str): 6-символьный код для подключения, уникальный среди незавершенных игр
         topic (str): Тема игры
         questions_per_team (int): Количество вопросов на команду
         status (str): Статус игры (waiting, in_progress, finished)
@@ -51,9 +51,19 @@ class Game(Base):
     """
 
     __tablename__ = "games"
+    __table_args__ = (
+        # PIN уникален только среди незавершенных игр: код завершенной игры можно выдать снова.
+        Index(
+            "uq_games_active_pin",
+            "pin",
+            unique=True,
+            sqlite_where=text("status != 'finished'"),
+        ),
+        Index("ix_games_status", "status"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
-    pin: Mapped[str] = mapped_column(String(6), unique=True, index=True)
+    pin: Mapped[str] = mapped_column(String(6), index=True)
     topic: Mapped[str] = mapped_column(String(255))
     questions_per_team: Mapped[int] = mapped_column(Integer)
     status: Mapped[str] = mapped_column(String(32), default="waiting")
@@ -74,6 +84,9 @@ class Game(Base):
     questions: Mapped[list["Question"]] = relationship(
         back_populates="game", cascade="all, delete-orphan"
     )
+    question_set: Mapped["QuestionSet | None"] = relationship(
+        back_populates="game", cascade="all, delete-orphan"
+    )
 
 
 class Player(Base):
@@ -99,12 +112,12 @@ class Player(Base):
             unique=True,
             sqlite_where=text("is_host = 1"),
         ),
+        # Состав игры в порядке входа — GameRuntime.load.
+        Index("ix_players_game_joined", "game_id", "joined_at"),
     )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
-    game_id: Mapped[int] = mapped_column(
-        ForeignKey("games.id", ondelete="CASCADE"), index=True
-    )
+    game_id: Mapped[int] = mapped_column(ForeignKey("games.id", ondelete="CASCADE"))
     user_id: Mapped[int | None] = mapped_column(
         ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True
     )
@@ -138,12 +151,11 @@ class Question(Base):
     """
 
     __tablename__ = "questions"
+    __table_args__ = (Index("ix_questions_game_team_order", "game_id", "team", "order_index"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
-    game_id: Mapped[int] = mapped_column(
-        ForeignKey("games.id", ondelete="CASCADE"), index=True
-    )
-    team: Mapped[str] = mapped_column(String(1), index=True)
+    game_id: Mapped[int] = mapped_column(ForeignKey("games.id", ondelete="CASCADE"))
+    team: Mapped[str] = mapped_column(String(1))
     order_index: Mapped[int] = mapped_column(Integer)
     text: Mapped[str] = mapped_column(Text)
     option_1: Mapped[str] = mapped_column(String(255))
@@ -155,3 +167,57 @@ class Question(Base):
 
     # Связи
     game: Mapped[Game] = relationship(back_populates="questions")
+
+
+class QuestionSet(Base):
+    """
+    Вопросы игры одной строкой (QUIZBATTLE_QUESTION_STORAGE=compact).
+
+    Атрибуты:
+        game_id (int): Идентификатор игры
+        questions_per_team (int): Вопросов на команду: первые в payload — команде A, остальные — B
+        payload (str): JSON-массив [текст, вариант 1..4, номер правильного] по порядку
+        answered (str): Отметки ответа по позициям payload, строка из 0 и 1
+    """
+
+    __tablename__ = "question_sets"
+
+    game_id: Mapped[int] = mapped_column(ForeignKey("games.id", ondelete="CASCADE"), primary_key=True)
+    questions_per_team: Mapped[int] = mapped_column(Integer)
+    payload: Mapped[str] = mapped_column(Text)
+    answered: Mapped[str] = mapped_column(Text)
+
+    # Связи
+    game: Mapped[Game] = relationship(back_populates="question_set")
+
+
+class PooledQuestion(Base):
+    """
+    Заранее сгенерированный вопрос из пула.
+
+    Атрибуты:
+        id (int): Уникальный идентификатор вопроса
+        topic_key (str): Нормализованная тема (нижний регистр, без лишних пробелов)
+        difficulty (str): Сложность (easy, medium, hard)
+        text (str): Текст вопроса
+        option_1 (str): Первый вариант ответа
+        option_2 (str): Второй вариант ответа
+        option_3 (str): Третий вариант ответа
+        option_4 (str): Четвертый вариант ответа
+        correct_option (int): Номер правильного варианта ответа (1-4)
+        created_at (datetime): Дата и время генерации
+    """
+
+    __tablename__ = "question_pool"
+    __table_args__ = (Index("ix_question_pool_topic_difficulty", "topic_key", "difficulty"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    topic_key: Mapped[str] = mapped_column(String(255))
+    difficulty: Mapped[str] = mapped_column(String(16))
+    text: Mapped[str] = mapped_column(Text)
+    option_1: Mapped[str] = mapped_column(String(255))
+    option_2: Mapped[str] = mapped_column(String(255))
+    option_3: Mapped[str] = mapped_column(String(255))
+    option_4: Mapped[str] = mapped_column(String(255))
+    correct_option: Mapped[int] = mapped_column(Integer)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
@@ -1,16 +1,19 @@
 """Маршруты API для приложения QuizBattle."""
 
+import asyncio
+import json
 import time
 from collections import defaultdict, deque
+from functools import partial
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from fastapi.responses import JSONResponse
 from fastapi import Cookie
 
-from app.database import SessionLocal, get_db
+from app.database import db_stats, get_db, run_db
 from app.models import User
 from app.schemas import (
     AuthResponse,
@@ -25,8 +28,10 @@ from app.schemas import (
     StartGameRequest,
     UserProfileStatsResponse,
 )
+from app.services.ai_service import get_timeweb_client, singleflight_stats
 from app.services.auth_service import auth_service
 from app.services.game_service import game_service
+from app.services.wire_format import negotiate_subprotocol
 from app.security import (
     create_player_token,
     create_user_session_token,
@@ -40,6 +45,12 @@ templates = Jinja2Templates(directory="app/templates")
 REQUEST_LOGS: dict[str, deque] = defaultdict(deque)
 
 
+def _json_with_state(fields: dict, state_json: str) -> Response:
+    """Ответ с полем state, подставленным из готового JSON без повторной сериализации."""
+    head = json.dumps(fields, ensure_ascii=False, separators=(",", ":"))
+    return Response(content=f'{head[:-1]},"state":{state_json}}}', media_type="application/json")
+
+
 def enforce_rate_limit(request: Request, limit: int = 90, window: int = 60) -> None:
     ip = request.client.host if request.client else "unknown"
     now = time.time()
@@ -128,7 +139,23 @@ def game_page(request: Request, pin: str):
 
 @router.get("/health")
 def health() -> dict:
-    return {"status": "ok"}
+    # Разомкнутый предохранитель AI не делает сервис нерабочим: игры идут на резервных вопросах.
+    return {"status": "ok", "ai": get_timeweb_client().breaker.stats()["state"]}
+
+
+@router.get("/metrics")
+async def metrics() -> dict:
+    # В event loop: счетчики соединений, игр и ящиков — словари, которые меняет только он.
+    return {
+        "websocket": game_service.manager.stats(),
+        "games": game_service.stats(),
+        "mailboxes": game_service.mailboxes.stats(),
+        "pins": game_service.pins.stats(),
+        "question_pool": game_service.question_pool.stats(),
+        "ai": {**get_timeweb_client().stats(), "singleflight": singleflight_stats()},
+        "timers": game_service.timers.stats(),
+        "db": db_stats.stats(),
+    }
 
 
 @router.post("/auth/register", response_model=AuthResponse)
@@ -195,13 +222,12 @@ def rating_data(request: Request, db: Session = Depends(get_db)):
 
 
 @router.post("/games", response_model=CreateGameResponse)
-def create_game(payload: CreateGameRequest, request: Request, db: Session = Depends(get_db)):
+async def create_game(payload: CreateGameRequest, request: Request):
     enforce_rate_limit(request)
     session_token = request.cookies.get("session_token")
-    effective_user_id = get_optional_authenticated_user_id(session_token, db)
+    effective_user_id = await run_db(partial(get_optional_authenticated_user_id, session_token))
 
-    game, host = game_service.create_game(
-        db,
+    game, host = await game_service.create_game(
         payload.host_name,
         payload.topic,
         payload.questions_per_team,
@@ -211,13 +237,9 @@ def create_game(payload: CreateGameRequest, request: Request, db: Session = Depe
     )
     player_token = create_player_token(game.pin, host.id)
     cookie_settings = get_cookie_settings()
-    response = JSONResponse(
-        content=CreateGameResponse(
-            pin=game.pin,
-            host_player_id=host.id,
-            player_token=player_token,
-            state=game_service.to_state(db, game),
-        ).dict()
+    response = _json_with_state(
+        {"pin": game.pin, "host_player_id": host.id, "player_token": player_token},
+        game_service.state_json(None, game),
     )
     response.set_cookie(
         key="player_token",
@@ -235,22 +257,18 @@ async def join_game(
     pin: str,
     payload: JoinGameRequest,
     request: Request,
-    db: Session = Depends(get_db),
     session_token: str | None = Cookie(default=None),
 ):
     enforce_rate_limit(request)
-    effective_user_id = get_optional_authenticated_user_id(session_token, db)
-    player = game_service.join_game(db, pin.upper(), payload.name, effective_user_id)
-    game = game_service.get_game(db, pin.upper())
-    await game_service.broadcast_state(db, game)
+    effective_user_id = await run_db(partial(get_optional_authenticated_user_id, session_token))
+    player = await game_service.join_game(pin.upper(), payload.name, effective_user_id)
+    game = await game_service.load_game(pin.upper())
+    game_service.schedule_broadcast(game.pin)
     player_token = create_player_token(pin.upper(), player.id)
     cookie_settings = get_cookie_settings()
-    response = JSONResponse(
-        content=JoinGameResponse(
-            player_id=player.id,
-            player_token=player_token,
-            state=game_service.to_state(db, game),
-        ).dict()
+    response = _json_with_state(
+        {"player_id": player.id, "player_token": player_token},
+        game_service.state_json(None, game),
     )
     response.set_cookie(
         key="player_token",
@@ -264,43 +282,72 @@ async def join_game(
 
 
 @router.post("/games/{pin}/start", response_model=GameStateOut)
-async def start_game(pin: str, payload: StartGameRequest, request: Request, db: Session = Depends(get_db)):
+async def start_game(pin: str, payload: StartGameRequest, request: Request):
     enforce_rate_limit(request)
-    game = await game_service.start_game(db, pin.upper(), payload.host_player_id)
-    return game_service.to_state(db, game)
+    pin = pin.upper()
+    # Ожидание вопросов — до ящика игры, чтобы не задерживать остальные действия комнаты.
+    await game_service.prepare_start(pin, payload.host_player_id)
+    game = await game_service.dispatch(pin, partial(game_service.start_game, None, pin, payload.host_player_id))
+    return Response(content=game_service.state_json(None, game), media_type="application/json")
 
 
 @router.get("/games/{pin}", response_model=GameStateOut)
-def game_state(pin: str, request: Request, db: Session = Depends(get_db)):
+async def game_state(pin: str, request: Request):
     enforce_rate_limit(request)
-    game = game_service.get_game(db, pin.upper())
-    return game_service.to_state(db, game)
+    # Состояние собирается в event loop, где живет игра; загрузка из БД — в потоке БД.
+    game = await game_service.load_game(pin.upper())
+    return Response(content=game_service.state_json(None, game), media_type="application/json")
 
 
 @router.websocket("/ws/{pin}/{player_id}")
-async def game_socket(websocket: WebSocket, pin: str, player_id: int, token: str | None = Query(default=None)):
+async def game_socket(
+    websocket: WebSocket,
+    pin: str,
+    player_id: int,
+    token: str | None = Query(default=None),
+    proto: str | None = Query(default=None),
+):
     pin = pin.upper()
-    db = SessionLocal()
+    # Долгой сессии на соединение нет: игра живет в памяти, а редкие обращения
+    # к БД (подъем игры, запись изменений) идут в потоке БД с короткой сессией.
     try:
         raw_token = token or websocket.query_params.get("player_token") or websocket.cookies.get("player_token")
         verify_player_token(pin, player_id, raw_token)
-        game_service.get_game(db, pin)
-        await game_service.manager.connect(pin, websocket)
-        await game_service.broadcast_state(db, game_service.get_game(db, pin))
+        game = await game_service.load_game(pin)
+        # PIN завершенной игры мог достаться новой комнате, а токен по-прежнему валиден.
+        if player_id not in game.players:
+            raise HTTPException(status_code=403, detail="Игрок не участвует в этой игре")
+        await game_service.manager.connect(
+            pin,
+            websocket,
+            player_id=player_id,
+            delta=proto == "delta",
+            subprotocol=negotiate_subprotocol(websocket.scope.get("subprotocols", [])),
+        )
+        # Игрок, снятый по обрыву соединения, возвращается в игру; новый сокет получает состояние.
+        await game_service.dispatch(pin, partial(game_service.reconnect_player, pin, player_id))
         while True:
             message = await websocket.receive_json()
+            game_service.manager.mark_alive(pin, websocket)
             action = message.get("action")
+            # Игру могли выгрузить из памяти, пока сокет молчал.
+            game = await game_service.load_game(pin)
+            if player_id not in game.players:
+                raise HTTPException(status_code=403, detail="Игрок не участвует в этой игре")
+            # Действия, меняющие игру, выполняются по очереди через ящик игры.
+            handler = None
             if action == "answer":
-                await game_service.process_answer(db, pin, player_id=player_id, option_index=int(message.get("option_index")))
+                handler = partial(game_service.process_answer, None, pin, player_id=player_id, option_index=int(message.get("option_index")))
             elif action == "vote":
-                await game_service.cast_vote(db, pin, player_id=player_id, choice=str(message.get("choice")))
+                handler = partial(game_service.cast_vote, None, pin, player_id=player_id, choice=str(message.get("choice")))
             elif action == "skip":
-                await game_service.process_answer(db, pin, player_id=player_id, option_index=None, skip=True)
+                handler = partial(game_service.process_answer, None, pin, player_id=player_id, option_index=None, skip=True)
             elif action == "transfer_captain":
-                await game_service.transfer_captain(db, pin, from_player_id=player_id, to_player_id=int(message.get("to_player_id")))
+                handler = partial(game_service.transfer_captain, None, pin, from_player_id=player_id, to_player_id=int(message.get("to_player_id")))
             elif action == "host_control":
-                await game_service.host_control(
-                    db,
+                handler = partial(
+                    game_service.host_control,
+                    None,
                     pin,
                     host_player_id=player_id,
                     action=str(message.get("control_action")),
@@ -308,12 +355,19 @@ async def game_socket(websocket: WebSocket, pin: str, player_id: int, token: str
                     topic=message.get("topic"),
                     difficulty=message.get("difficulty"),
                 )
+            if handler is not None:
+                await game_service.dispatch(pin, handler)
+            elif action == "resync":
+                await game_service.send_snapshot(None, game, websocket)
             elif action == "ping":
-                await websocket.send_json({"type": "pong"})
+                await game_service.manager.send(pin, websocket, {"type": "pong"})
     except HTTPException:
         await websocket.close(code=1008)
     except WebSocketDisconnect:
         pass
+    except asyncio.CancelledError:
+        # Сокет закрыл reaper: отмена ожидаемая, игрок уже снят через remove_player.
+        if not game_service.manager.was_reaped(websocket):
+            raise
     finally:
         game_service.manager.disconnect(pin, websocket)
-        db.close()
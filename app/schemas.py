@@ -1,6 +1,7 @@
 """Схемы данных для приложения QuizBattle."""
 
 import re
+from datetime import datetime
 
 from pydantic import BaseModel, Field
 from pydantic import field_validator
@@ -87,6 +88,8 @@ class GameStateOut(BaseModel):
     status: str
     phase: str
     countdown_seconds: int
+    phase_deadline: datetime | None = None
+    questions_ready: bool = True
     questions_per_team: int
     current_team: str | None
     score_a: int
@@ -1,12 +1,39 @@
-import json
+import asyncio
 import os
 import random
-from typing import Any, List, Dict
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict, Iterator, List
 import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.question_stream import QuestionArrayParser, iter_sse_content
 
 load_dotenv()
 
+# Отдельный пул потоков для запросов к AI: они не занимают ни event loop, ни пул FastAPI.
+# Потоков больше, чем одновременных запросов: лишние ждут слот в TimewebClient.
+AI_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("QUIZBATTLE_AI_WORKERS", "16")),
+    thread_name_prefix="quizbattle-ai",
+)
+# Общий бюджет одной генерации вместе с повторами.
+GENERATION_DEADLINE = float(os.getenv("QUIZBATTLE_GENERATION_DEADLINE", "45"))
+GENERATION_ATTEMPTS = 3
+AI_CONCURRENCY = int(os.getenv("QUIZBATTLE_AI_CONCURRENCY", "4"))
+AI_QUEUE_TIMEOUT = float(os.getenv("QUIZBATTLE_AI_QUEUE_TIMEOUT", "30"))
+AI_BREAKER_FAILURES = int(os.getenv("QUIZBATTLE_AI_BREAKER_FAILURES", "3"))
+AI_BREAKER_COOLDOWN = float(os.getenv("QUIZBATTLE_AI_BREAKER_COOLDOWN", "30"))
+# Потоковый ответ (SSE, stream=true): вопросы разбираются по мере поступления.
+AI_STREAM = os.getenv("QUIZBATTLE_AI_STREAM", "0") == "1"
+
 FALLBACK_QUESTIONS = [
     {"text": "Что из перечисленного является языком программирования?", "options": ["HTTP", "Python", "SQLite", "CSS"],
      "correct_option": 2},
@@ -26,7 +53,16 @@ FALLBACK_QUESTIONS = [
 
 
 class TimewebClient:
-    def __init__(self) -> None:
+    """
+    Клиент AI, общий для процесса.
+
+    Держит requests.Session с keep-alive, поэтому повторные запросы не платят
+    за DNS, TCP и TLS. Одновременно выполняется не больше AI_CONCURRENCY
+    запросов; остальные ждут слот до AI_QUEUE_TIMEOUT секунд. Если провайдер
+    раз за разом падает, предохранитель сразу отдает резервные вопросы.
+    """
+
+    def __init__(self, concurrency: int = AI_CONCURRENCY, queue_timeout: float = AI_QUEUE_TIMEOUT) -> None:
         self.api_key = os.getenv("TIMEWEB_API_KEY", "")
         self.api_base = os.getenv(
             "TIMEWEB_API_BASE",
@@ -34,10 +70,85 @@ class TimewebClient:
         )
         self.model = os.getenv("TIMEWEB_MODEL", "claude3.5")
         self.timeout = int(os.getenv("TIMEWEB_TIMEOUT", "60"))  # Увеличил таймаут для большого пака
+        self.queue_timeout = queue_timeout
+        self.session = requests.Session()
+        self.session.headers.update({"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.concurrency = concurrency
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self.breaker = CircuitBreaker(AI_BREAKER_FAILURES, AI_BREAKER_COOLDOWN)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.counters: Counter = Counter()
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.request_total = 0.0
+        self.request_max = 0.0
 
     def is_configured(self) -> bool:
         return bool(self.api_key)
 
+    @contextmanager
+    def _request(self, payload: dict, timeout: float) -> Iterator[requests.Response]:
+        """
+        POST /chat/completions в пределах timeout секунд, включая ожидание слота.
+
+        Слот занят, пока ответ читается (для потока — до конца потока). Если
+        слот не освободился за queue_timeout (или за timeout), бросает TimeoutError.
+        """
+        started = time.monotonic()
+        with self._lock:
+            self.waiting += 1
+        acquired = self._slots.acquire(timeout=max(0.0, min(self.queue_timeout, timeout)))
+        waited = time.monotonic() - started
+        with self._lock:
+            self.waiting -= 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            if not acquired:
+                self.counters["rejected"] += 1
+                raise TimeoutError(f"нет свободного слота к AI за {waited:.1f} с")
+            self.in_flight += 1
+        try:
+            with self.session.post(
+                f"{self.api_base}/chat/completions",
+                json=payload,
+                timeout=max(1.0, timeout - waited),
+                stream=bool(payload.get("stream")),
+            ) as response:
+                yield response
+        except requests.RequestException:
+            with self._lock:
+                self.counters["errors"] += 1
+            raise
+        finally:
+            elapsed = time.monotonic() - started - waited
+            with self._lock:
+                self.in_flight -= 1
+                self.counters["requests"] += 1
+                self.request_total += elapsed
+                self.request_max = max(self.request_max, elapsed)
+            self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests_done = self.counters["requests"]
+            waits = requests_done + self.counters["rejected"]
+            return {
+                "concurrency": self.concurrency,
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                **self.counters,
+                "wait_ms_avg": round(self.wait_total / waits * 1000, 1) if waits else 0.0,
+                "wait_ms_max": round(self.wait_max * 1000, 1),
+                "request_ms_avg": round(self.request_total / requests_done * 1000, 1) if requests_done else 0.0,
+                "request_ms_max": round(self.request_max * 1000, 1),
+                "breaker": self.breaker.stats(),
+            }
+
     def _validate_questions(self, questions: List[dict], count: int, used_texts: set) -> List[dict]:
         valid: List[dict] = []
         for item in questions:
@@ -61,8 +172,70 @@ class TimewebClient:
 
         return valid
 
-    def generate_batch_questions(self, topic: str, total_count: int, used_texts: set, difficulty: str = "medium") -> List[dict]:
-        """Генерирует сразу большое количество вопросов одним запросом."""
+    def generate_batch_questions(
+            self,
+            topic: str,
+            total_count: int,
+            used_texts: set,
+            difficulty: str = "medium",
+            cancel: threading.Event | None = None,
+            deadline: float | None = None,
+    ) -> List[dict]:
+        """
+        Генерирует сразу большое количество вопросов одним запросом.
+
+        Все попытки укладываются в deadline (time.monotonic, по умолчанию
+        GENERATION_DEADLINE от начала), cancel прерывает повторы. Пока
+        предохранитель разомкнут, запросы не отправляются.
+
+        Ответ разбирается по вопросу (при AI_STREAM — прямо из потока SSE):
+        битый вопрос не выбрасывает остальные, а повтор просит только недостающие.
+        """
+        if deadline is None:
+            deadline = time.monotonic() + GENERATION_DEADLINE
+        local_used = set(used_texts)
+        collected: List[dict] = []
+        for attempt in range(GENERATION_ATTEMPTS):
+            missing = total_count - len(collected)
+            timeout = min(self.timeout, deadline - time.monotonic())
+            if (cancel is not None and cancel.is_set()) or timeout <= 0:
+                print("⏱️ Генерация прервана: истек срок или запрос отменен")
+                break
+            if not self.breaker.allow():
+                print("🔌 Предохранитель разомкнут, запрос к AI не отправляю")
+                break
+            try:
+                print(f"📡 Запрос к AI: Генерация пака из {missing} вопросов...")
+                payload = self._build_payload(topic, missing, difficulty, [q["text"] for q in collected])
+                with self._request(payload, timeout) as response:
+                    response.raise_for_status()
+                    self.breaker.record_success()
+                    parser = QuestionArrayParser()
+                    chunks = iter_sse_content(response.iter_lines(decode_unicode=True)) if AI_STREAM else [
+                        response.json()["choices"][0]["message"]["content"]
+                    ]
+                    for chunk in chunks:
+                        collected.extend(self._validate_questions(parser.feed(chunk), total_count - len(collected), local_used))
+                        if len(collected) >= total_count:
+                            return collected
+                        if time.monotonic() >= deadline or (cancel is not None and cancel.is_set()):
+                            break
+                # Валидные вопросы остаются, следующая попытка просит только недостающие.
+                print(f"⚠️ Получено {len(collected)}/{total_count} валидных вопросов, пробую еще раз...")
+            except requests.RequestException as e:
+                self.breaker.record_failure()
+                print(f"❌ Ошибка генерации (попытка {attempt + 1}): {e}")
+            except Exception as e:
+                self.breaker.release()
+                print(f"❌ Ошибка генерации (попытка {attempt + 1}): {e}")
+
+        # Если AI подвел, добираем из фолбека
+        print("🛟 Использую резервные вопросы")
+        with self._lock:
+            self.counters["fallbacks"] += 1
+        return collected + _fallback_questions(total_count - len(collected), local_used)
+
+    def _build_payload(self, topic: str, count: int, difficulty: str, exclude: List[str]) -> dict:
         # Явный промпт для JSON формата, чтобы нейросеть не ошибалась
         difficulty_hint = {
             "easy": "простого уровня: базовые факты и очевидные варианты",
@@ -71,51 +244,47 @@ class TimewebClient:
         }.get(difficulty, "среднего уровня")
 
         prompt = (
-            f"Сгенерируй {total_count} уникальных вопросов для викторины по теме '{topic}' ни больше, ни меньше."
+            f"Сгенерируй {count} уникальных вопросов для викторины по теме '{topic}' ни больше, ни меньше."
             f"со сложностью '{difficulty}' ({difficulty_hint}). "
         )
+        if exclude:
+            prompt += "Не повторяй вопросы: " + "; ".join(exclude) + ". "
 
-        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
         payload = {
             "model": self.model,
             "temperature": 0.6,  # Чуть выше, чтобы вопросы были разнообразнее
             "messages": [{"role": "user", "content": prompt}],
         }
+        if AI_STREAM:
+            payload["stream"] = True
+        return payload
 
-        for attempt in range(3):
-            try:
-                print(f"📡 Запрос к AI: Генерация пака из {total_count} вопросов...")
-                response = requests.post(f"{self.api_base}/chat/completions", headers=headers, json=payload,
-                                         timeout=self.timeout)
-                response.raise_for_status()
-
-                content = response.json()["choices"][0]["message"]["content"].strip()
-                if "```" in content:
-                    content = content.split("```")[1].replace("json", "").strip()
-
-                parsed = json.loads(content)
-                if isinstance(parsed, dict) and "data" in parsed: parsed = parsed["data"]
-
-                local_used = set(used_texts)
-                questions = self._validate_questions(parsed, total_count, local_used)
-                if len(questions) >= total_count:
-                    return questions
-                print(f"⚠️ Получено {len(questions)}/{total_count} валидных вопросов, пробую еще раз...")
-            except Exception as e:
-                print(f"❌ Ошибка генерации (попытка {attempt + 1}): {e}")
 
-        # Если AI подвел, берем из фолбека
-        print("🛟 Использую резервные вопросы")
-        pool = [q for q in FALLBACK_QUESTIONS if q["text"] not in used_texts]
-        random.shuffle(pool)
-        return pool[:total_count]
+_client: TimewebClient | None = None
+_client_lock = threading.Lock()
+
+
+def get_timeweb_client() -> TimewebClient:
+    """Общий для процесса клиент AI (создается при первом обращении)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = TimewebClient()
+    return _client
+
+
+def _fallback_questions(count: int, used_texts: set) -> List[dict]:
+    pool = [q for q in FALLBACK_QUESTIONS if q["text"] not in used_texts]
+    random.shuffle(pool)
+    return pool[:count]
 
 
 def get_questions_for_teams(teams: List[str], topic: str, q_per_team: int = 2) -> Dict[str, List[dict]]:
     """
     Главная функция: делает 1 запрос и распределяет вопросы по командам.
     """
-    client = TimewebClient()
+    client = get_timeweb_client()
     total_needed = len(teams) * q_per_team
     used_texts = set()
 
@@ -134,24 +303,140 @@ def get_questions_for_teams(teams: List[str], topic: str, q_per_team: int = 2) -
     return team_assignments
 
 
-def generate_questions(topic: str, count: int, used_texts: set = None, difficulty: str = "medium") -> List[dict]:
+def generate_questions(
+        topic: str,
+        count: int,
+        used_texts: set = None,
+        difficulty: str = "medium",
+        cancel: threading.Event | None = None,
+        deadline: float | None = None,
+) -> List[dict]:
     """
     Генерирует пачку вопросов за один запрос.
-    Используется как совместимый интерфейс для старого кода,
-    но теперь работает через batch-метод.
+    Блокирующая версия: из асинхронного кода используйте generate_questions_async.
     """
     if used_texts is None:
         used_texts = set()
 
-    client = TimewebClient()
+    client = get_timeweb_client()
     # Пытаемся получить всё одним махом
-    questions = client.generate_batch_questions(topic, count, used_texts, difficulty=difficulty)
+    questions = client.generate_batch_questions(
+        topic, count, used_texts, difficulty=difficulty, cancel=cancel, deadline=deadline
+    )
 
     # Если вдруг AI выдал меньше, чем просили, добираем из заглушек
     if len(questions) < count:
-        needed = count - len(questions)
-        pool = [q for q in FALLBACK_QUESTIONS if q["text"] not in used_texts]
-        random.shuffle(pool)
-        questions.extend(pool[:needed])
+        questions.extend(_fallback_questions(count - len(questions), used_texts))
 
     return questions[:count]
+
+
+def normalize_topic(topic: str) -> str:
+    """Ключ темы: регистр, лишние пробелы и «ё» не различаются."""
+    return re.sub(r"\s+", " ", topic.strip().lower().replace("ё", "е"))
+
+
+class _Flight:
+    """Идущая генерация, которую разделяют одинаковые запросы."""
+
+    __slots__ = ("count", "task", "waiters")
+
+    def __init__(self, count: int, task: asyncio.Task) -> None:
+        self.count = count
+        self.task = task
+        self.waiters = 0
+
+
+_flights: dict[tuple[str, str], _Flight] = {}
+_flight_counters: Counter = Counter()
+
+
+def _shuffled_copy(questions: List[dict]) -> List[dict]:
+    """Независимая копия: свой порядок вопросов и вариантов ответа."""
+    result = []
+    for q in questions:
+        order = random.sample(range(4), 4)
+        result.append({
+            "text": q["text"],
+            "options": [q["options"][i] for i in order],
+            "correct_option": order.index(q["correct_option"] - 1) + 1,
+        })
+    random.shuffle(result)
+    return result
+
+
+async def generate_questions_async(
+        topic: str,
+        count: int,
+        used_texts: set = None,
+        difficulty: str = "medium",
+        timeout: float = GENERATION_DEADLINE,
+) -> List[dict]:
+    """
+    Генерирует вопросы, объединяя одинаковые одновременные запросы.
+
+    Запросы с той же темой (после normalize_topic) и сложностью ждут уже
+    идущую генерацию, если она заказана не меньше чем на count вопросов, и
+    получают свою перемешанную копию. Больший запрос запускает новую
+    генерацию, и следующие запросы присоединяются уже к ней. Запросы со
+    списком исключений (used_texts) не объединяются.
+    """
+    if used_texts:
+        _flight_counters["exclusive"] += 1
+        return await _generate_async(topic, count, used_texts, difficulty, timeout)
+    key = (normalize_topic(topic), difficulty)
+    flight = _flights.get(key)
+    if flight is None or flight.count < count or flight.task.done():
+        flight = _Flight(count, asyncio.create_task(_generate_async(topic, count, set(), difficulty, timeout)))
+        _flights[key] = flight
+        flight.task.add_done_callback(lambda _, f=flight: _flights.get(key) is f and _flights.pop(key))
+        _flight_counters["upstream"] += 1
+    else:
+        _flight_counters["coalesced"] += 1
+    flight.waiters += 1
+    try:
+        questions = await asyncio.shield(flight.task)
+    except asyncio.CancelledError:
+        # Генерацию отменяем, только если ее больше никто не ждет.
+        flight.waiters -= 1
+        if flight.waiters == 0:
+            flight.task.cancel()
+        raise
+    flight.waiters -= 1
+    return _shuffled_copy(questions)[:count]
+
+
+def singleflight_stats() -> dict:
+    return {"in_flight": len(_flights), **_flight_counters}
+
+
+async def _generate_async(
+        topic: str,
+        count: int,
+        used_texts: set,
+        difficulty: str,
+        timeout: float,
+) -> List[dict]:
+    """
+    Генерирует вопросы в AI_EXECUTOR, не блокируя event loop.
+
+    Вся генерация вместе с повторами укладывается в timeout секунд; если
+    не успела — возвращаются резервные вопросы. При отмене корутины поток
+    прекращает повторные попытки.
+    """
+    cancel = threading.Event()
+    deadline = time.monotonic() + timeout
+    future = asyncio.get_running_loop().run_in_executor(
+        AI_EXECUTOR,
+        partial(generate_questions, topic, count, set(used_texts), difficulty, cancel, deadline),
+    )
+    try:
+        # Поток сам укладывается в deadline; запас на случай, если он завис вне запроса.
+        return await asyncio.wait_for(asyncio.shield(future), timeout + 5)
+    except asyncio.TimeoutError:
+        cancel.set()
+        print("🛟 Генерация не уложилась в срок, использую резервные вопросы")
+        return _fallback_questions(count, used_texts)
+    except asyncio.CancelledError:
+        cancel.set()
+        raise
@@ -0,0 +1,48 @@
+"""
+Шина рассылки.
+
+ConnectionManager публикует готовые кадры в шину, а шина доставляет их
+менеджеру, который раздает их своим сокетам. Сейчас есть только шина
+одного процесса: состояние игр живет в памяти воркера, поэтому запуск
+с несколькими воркерами не поддерживается (см. README).
+"""
+
+from collections import Counter
+from typing import Awaitable, Callable
+
+Deliver = Callable[[dict], Awaitable[None]]
+
+
+class BroadcastBus:
+    """Базовая шина: доставка только в текущий процесс."""
+
+    name = "local"
+
+    def __init__(self) -> None:
+        self._deliver: Deliver | None = None
+        self.counters: Counter = Counter()
+
+    def bind(self, deliver: Deliver) -> None:
+        """Назначает получателя сообщений в текущем процессе."""
+        self._deliver = deliver
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def publish(self, message: dict) -> None:
+        self.counters["published"] += 1
+        await self._deliver_local(message)
+
+    async def _deliver_local(self, message: dict) -> None:
+        if self._deliver is not None:
+            await self._deliver(message)
+
+    def stats(self) -> dict:
+        return {"backend": self.name, **self.counters}
+
+
+class InProcessBus(BroadcastBus):
+    """Шина одного процесса."""
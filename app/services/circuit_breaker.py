@@ -0,0 +1,79 @@
+"""
+Предохранитель для запросов к AI.
+
+После failure_threshold ошибок подряд предохранитель размыкается: запросы
+не уходят к провайдеру cooldown секунд, генерация сразу берет резервные
+вопросы. Затем один пробный запрос (half-open) проверяет, ожил ли
+провайдер: успех замыкает цепь, ошибка размыкает ее на новый cooldown.
+"""
+
+import threading
+import time
+from collections import Counter
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.counters: Counter = Counter()
+
+    def allow(self) -> bool:
+        """Можно ли сейчас обращаться к провайдеру; в half-open пропускает один пробный запрос."""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                self.counters["probes"] += 1
+                return True
+            self.counters["short_circuited"] += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != CLOSED:
+                print("✅ AI снова отвечает, предохранитель замкнут")
+            self.state = CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self.counters["failures"] += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.counters["opened"] += 1
+                    print(f"🔌 AI недоступен, запросы приостановлены на {self.cooldown:.0f} с")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def release(self) -> None:
+        """Попытка закончилась без ответа провайдера (например, не дождалась слота)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            retry_in = 0.0
+            if self.state == OPEN:
+                retry_in = max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "retry_in": round(retry_in, 1),
+                **self.counters,
+            }
@@ -0,0 +1,125 @@
+"""
+Почтовые ящики игр.
+
+Все действия над игрой — ходы из WebSocket, старт, срабатывания таймеров,
+снятие отвалившихся игроков — ставятся в ящик этой игры и выполняются
+строго по одному в порядке поступления. Разные игры обрабатываются
+независимо. Обработчик ящика живет, пока в ящике есть сообщения: накопленная
+пачка разбирается целиком, после чего вызывается on_batch_end — там
+GameService делает одну рассылку состояния на всю пачку.
+"""
+
+import asyncio
+import time
+from collections import Counter, deque
+from typing import Any, Awaitable, Callable
+
+Action = Callable[[], Awaitable[Any]]
+
+
+class _Mailbox:
+    __slots__ = ("pin", "queue", "consumer", "processed", "errors", "busy_total", "busy_max")
+
+    def __init__(self, pin: str) -> None:
+        self.pin = pin
+        self.queue: deque[tuple[Action, asyncio.Future | None]] = deque()
+        self.consumer: asyncio.Task | None = None
+        self.processed = 0
+        self.errors = 0
+        self.busy_total = 0.0
+        self.busy_max = 0.0
+
+
+class GameMailboxes:
+    def __init__(self) -> None:
+        self._boxes: dict[str, _Mailbox] = {}
+        self.on_batch_start: Callable[[str], None] | None = None
+        self.on_batch_end: Callable[[str], Awaitable[None]] | None = None
+        self.counters: Counter = Counter()
+
+    async def call(self, pin: str, action: Action) -> Any:
+        """Выполняет действие в очереди игры и возвращает его результат (или исключение)."""
+        future = asyncio.get_running_loop().create_future()
+        self._put(pin, action, future)
+        return await future
+
+    def post(self, pin: str, action: Action) -> None:
+        """Ставит действие в очередь без ожидания; ошибки только считаются и пишутся в лог."""
+        self._put(pin, action, None)
+
+    def _put(self, pin: str, action: Action, future: asyncio.Future | None) -> None:
+        box = self._boxes.get(pin)
+        if box is None:
+            box = self._boxes[pin] = _Mailbox(pin)
+        box.queue.append((action, future))
+        self.counters["received"] += 1
+        if box.consumer is None or box.consumer.done():
+            box.consumer = asyncio.create_task(self._consume(box))
+
+    async def _consume(self, box: _Mailbox) -> None:
+        while box.queue:
+            if self.on_batch_start:
+                self.on_batch_start(box.pin)
+            try:
+                while box.queue:
+                    action, future = box.queue.popleft()
+                    await self._run(box, action, future)
+            finally:
+                if self.on_batch_end:
+                    await self.on_batch_end(box.pin)
+            self.counters["batches"] += 1
+
+    async def _run(self, box: _Mailbox, action: Action, future: asyncio.Future | None) -> None:
+        started = time.perf_counter()
+        try:
+            result = await action()
+        except asyncio.CancelledError:
+            if future is not None and not future.done():
+                future.cancel()
+            raise
+        except Exception as exc:
+            box.errors += 1
+            if future is None:
+                print(f"❌ Ошибка действия в игре {box.pin}: {exc}")
+            elif not future.done():
+                future.set_exception(exc)
+        else:
+            if future is not None and not future.done():
+                future.set_result(result)
+        finally:
+            busy = time.perf_counter() - started
+            box.processed += 1
+            box.busy_total += busy
+            box.busy_max = max(box.busy_max, busy)
+
+    def close(self, pin: str) -> None:
+        """Удаляет ящик игры; недоставленные действия отменяются."""
+        box = self._boxes.pop(pin, None)
+        if box is None:
+            return
+        for _, future in box.queue:
+            if future is not None and not future.done():
+                future.cancel()
+        box.queue.clear()
+        if box.consumer and not box.consumer.done() and box.consumer is not asyncio.current_task():
+            box.consumer.cancel()
+
+    def stats(self, top: int = 20) -> dict:
+        boxes = list(self._boxes.values())
+        busiest = sorted(boxes, key=lambda b: b.busy_max, reverse=True)[:top]
+        return {
+            "rooms": len(boxes),
+            "queued": sum(len(b.queue) for b in boxes),
+            "max_depth": max((len(b.queue) for b in boxes), default=0),
+            **self.counters,
+            "busiest": {
+                b.pin: {
+                    "depth": len(b.queue),
+                    "processed": b.processed,
+                    "errors": b.errors,
+                    "avg_ms": round(b.busy_total / b.processed * 1000, 2) if b.processed else 0.0,
+                    "max_ms": round(b.busy_max * 1000, 2),
+                }
+                for b in busiest
+            },
+        }
@@ -0,0 +1,390 @@
+"""
+Состояние активной игры в памяти.
+
+GameRuntime держит строку игры, заранее загруженные вопросы и состав
+игроков и служит источником истины, пока игра идет. Игровые действия
+меняют только память и помечают изменения; в SQLite они уходят
+отложенной записью (write-behind) через persist_changes.
+
+Набор вопросов пишется одним запросом (store_questions): построчно в
+questions — одним многострочным INSERT, а в компактном режиме
+(QUIZBATTLE_QUESTION_STORAGE=compact) — одной строкой question_sets
+с упакованными вариантами, которая и читается одним запросом.
+"""
+
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, insert, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.models import Game, Player, Question, QuestionSet
+
+QUESTION_STORAGE = os.getenv("QUIZBATTLE_QUESTION_STORAGE", "rows")
+
+GAME_FIELDS = (
+    "topic",
+    "questions_per_team",
+    "status",
+    "current_team",
+    "current_index_a",
+    "current_index_b",
+    "score_a",
+    "score_b",
+    "difficulty",
+    "phase",
+    "question_started_at",
+)
+
+
+def _empty_team_stats() -> dict[str, dict[str, int]]:
+    return {
+        "A": {"correct": 0, "incorrect": 0, "timeout": 0, "speed_bonus": 0},
+        "B": {"correct": 0, "incorrect": 0, "timeout": 0, "speed_bonus": 0},
+    }
+
+
+def _as_utc(value: datetime | None) -> datetime | None:
+    if value is None or value.tzinfo is not None:
+        return value
+    return value.replace(tzinfo=timezone.utc)
+
+
+class QuestionSlot:
+    """Вопрос в памяти; в компактном хранении id — позиция в наборе."""
+
+    __slots__ = ("id", "team", "order_index", "text", "options", "correct_option", "answered")
+
+    def __init__(
+        self,
+        id: int,
+        team: str,
+        order_index: int,
+        text: str,
+        options: list[str],
+        correct_option: int,
+        answered: bool = False,
+    ) -> None:
+        self.id = id
+        self.team = team
+        self.order_index = order_index
+        self.text = text
+        self.options = options
+        self.correct_option = correct_option
+        self.answered = answered
+
+    @classmethod
+    def from_model(cls, question: Question) -> "QuestionSlot":
+        return cls(
+            question.id,
+            question.team,
+            question.order_index,
+            question.text,
+            [question.option_1, question.option_2, question.option_3, question.option_4],
+            question.correct_option,
+            bool(question.answered),
+        )
+
+
+def _team_position(position: int, questions_per_team: int) -> tuple[str, int]:
+    """Первые questions_per_team вопросов набора — команде A, остальные — B."""
+    if position < questions_per_team:
+        return "A", position
+    return "B", position - questions_per_team
+
+
+def _unpack_question_set(question_set: QuestionSet) -> list[QuestionSlot]:
+    answered = question_set.answered
+    slots = []
+    for position, (text, *options, correct_option) in enumerate(json.loads(question_set.payload)):
+        team, order_index = _team_position(position, question_set.questions_per_team)
+        slots.append(
+            QuestionSlot(position, team, order_index, text, options, correct_option, answered[position : position + 1] == "1")
+        )
+    return slots
+
+
+def load_questions(db: Session, game_id: int) -> tuple[list[QuestionSlot], bool]:
+    """Вопросы игры и признак компактного хранения; набор читается одним запросом."""
+    if QUESTION_STORAGE == "compact":
+        question_set = db.get(QuestionSet, game_id)
+        if question_set is not None:
+            return _unpack_question_set(question_set), True
+    rows = db.query(Question).filter(Question.game_id == game_id).all()
+    if rows or QUESTION_STORAGE == "compact":
+        return [QuestionSlot.from_model(q) for q in rows], False
+    # Игра записана в компактном режиме, а сервер запущен в построчном.
+    question_set = db.get(QuestionSet, game_id)
+    return (_unpack_question_set(question_set), True) if question_set is not None else ([], False)
+
+
+def store_questions(
+    db: Session, game_id: int, questions_per_team: int, generated: list[dict], replace: bool
+) -> tuple[list[QuestionSlot], bool]:
+    """
+    Записывает набор вопросов игры и возвращает его слоты.
+
+    Новый набор — один запрос: многострочный INSERT ... RETURNING id или
+    upsert строки question_sets. replace=True сначала удаляет прежние
+    строки questions (перезапуск игры); компактный набор перезаписывается
+    тем же upsert, так что и перезапуск обходится одним запросом.
+    """
+    if QUESTION_STORAGE == "compact":
+        payload = json.dumps(
+            [[q["text"], *q["options"][:4], q["correct_option"]] for q in generated], ensure_ascii=False
+        )
+        values = {"questions_per_team": questions_per_team, "payload": payload, "answered": "0" * len(generated)}
+        db.execute(
+            sqlite_insert(QuestionSet)
+            .values(game_id=game_id, **values)
+            .on_conflict_do_update(index_elements=[QuestionSet.game_id], set_=values)
+        )
+        db.commit()
+        slots = [
+            QuestionSlot(position, *_team_position(position, questions_per_team), q["text"], list(q["options"][:4]),
+                         q["correct_option"])
+            for position, q in enumerate(generated)
+        ]
+        return slots, True
+
+    rows = []
+    for position, q in enumerate(generated):
+        team, order_index = _team_position(position, questions_per_team)
+        rows.append({
+            "game_id": game_id,
+            "team": team,
+            "order_index": order_index,
+            "text": q["text"],
+            "option_1": q["options"][0],
+            "option_2": q["options"][1],
+            "option_3": q["options"][2],
+            "option_4": q["options"][3],
+            "correct_option": q["correct_option"],
+            "answered": False,
+        })
+    if replace:
+        db.execute(delete(Question).where(Question.game_id == game_id))
+    # Порядок RETURNING в SQLite не гарантирован (а sort_by_parameter_order дробит вставку
+    # на запросы по строке), поэтому id сопоставляются по команде и номеру.
+    returned = db.execute(insert(Question).returning(Question.id, Question.team, Question.order_index), rows) if rows else []
+    ids = {(team, order_index): question_id for question_id, team, order_index in returned}
+    db.commit()
+    slots = [
+        QuestionSlot(ids[(row["team"], row["order_index"])], row["team"], row["order_index"], row["text"],
+                     [row["option_1"], row["option_2"], row["option_3"], row["option_4"]], row["correct_option"])
+        for row in rows
+    ]
+    return slots, False
+
+
+class PlayerSlot:
+    __slots__ = ("id", "user_id", "name", "team", "is_host", "is_captain", "active")
+
+    def __init__(self, player: Player) -> None:
+        self.id = player.id
+        self.user_id = player.user_id
+        self.name = player.name
+        self.team = player.team
+        self.is_host = bool(player.is_host)
+        self.is_captain = bool(player.is_captain)
+        self.active = bool(player.active)
+
+
+class GameRuntime:
+    """Игра в памяти: поля строки games, вопросы, игроки и состояние раунда."""
+
+    __slots__ = (
+        "id",
+        "pin",
+        *GAME_FIELDS,
+        "questions",
+        "players",
+        "votes",
+        "vote_counts",
+        "team_stats",
+        "paused_remaining",
+        "paused_elapsed",
+        "phase_deadline",
+        "questions_ready",
+        "questions_task",
+        "compact_questions",
+        "dropped_players",
+        "dirty",
+        "dirty_players",
+        "dirty_questions",
+        "flush_task",
+        "last_activity",
+    )
+
+    def __init__(
+        self, game: Game, players: list[Player], questions: list[QuestionSlot], compact_questions: bool = False
+    ) -> None:
+        self.id = game.id
+        self.pin = game.pin
+        for field in GAME_FIELDS:
+            setattr(self, field, getattr(game, field))
+        self.question_started_at = _as_utc(game.question_started_at)
+        self.questions: dict[tuple[str, int], QuestionSlot] = {}
+        self.players: dict[int, PlayerSlot] = {}
+        self.set_questions(questions, compact_questions)
+        for player in players:
+            self.add_player(player)
+        self.votes: dict[int, str] = {}
+        self.vote_counts: dict[str, int] = {}
+        self.team_stats = _empty_team_stats()
+        self.paused_remaining: int | None = None
+        self.paused_elapsed: int | None = None
+        self.phase_deadline: datetime | None = None
+        # Вопросы генерируются в фоне, пока игроки собираются в лобби.
+        self.questions_ready = bool(questions)
+        self.questions_task = None
+        # Сняты по обрыву соединения (не выгнаны ведущим) — возвращаются при переподключении.
+        self.dropped_players: set[int] = set()
+        self.dirty = False
+        self.dirty_players: set[int] = set()
+        self.dirty_questions: set[int] = set()
+        self.flush_task = None
+        self.last_activity = time.monotonic()
+
+    @classmethod
+    def load(cls, db: Session, game: Game) -> "GameRuntime":
+        players = db.query(Player).filter(Player.game_id == game.id).order_by(Player.joined_at.asc(), Player.id.asc()).all()
+        questions, compact = load_questions(db, game.id)
+        return cls(game, players, questions, compact)
+
+    def set_questions(self, questions: list[QuestionSlot], compact: bool = False) -> None:
+        self.questions = {(q.team, q.order_index): q for q in questions}
+        self.compact_questions = compact
+        self.questions_ready = bool(questions)
+        self.dirty_questions = set()
+
+    def add_player(self, player: Player) -> PlayerSlot:
+        slot = PlayerSlot(player)
+        self.players[slot.id] = slot
+        return slot
+
+    def active_players(self) -> list[PlayerSlot]:
+        return [p for p in self.players.values() if p.active]
+
+    def active_player(self, player_id: int | None) -> PlayerSlot | None:
+        player = self.players.get(player_id)
+        return player if player and player.active else None
+
+    def current_question(self) -> QuestionSlot | None:
+        if self.status != "in_progress" or self.phase != "question" or not self.current_team:
+            return None
+        index = self.current_index_a if self.current_team == "A" else self.current_index_b
+        return self.questions.get((self.current_team, index))
+
+    def reset_round_state(self) -> None:
+        self.votes = {}
+        self.vote_counts = {}
+        self.team_stats = _empty_team_stats()
+        self.paused_remaining = None
+        self.paused_elapsed = None
+        self.phase_deadline: datetime | None = None
+
+    def snapshot(self, timer_left: float | None) -> dict:
+        """Состояние раунда, которого нет в БД, — для переживания перезапуска."""
+        return {
+            "id": self.id,
+            "votes": {str(pid): choice for pid, choice in self.votes.items()},
+            "team_stats": self.team_stats,
+            "paused_remaining": self.paused_remaining,
+            "paused_elapsed": self.paused_elapsed,
+            "timer_left": timer_left,
+            "dropped_players": sorted(self.dropped_players),
+        }
+
+    def restore(self, data: dict) -> None:
+        self.votes = {int(pid): choice for pid, choice in data.get("votes", {}).items()}
+        self.vote_counts = {}
+        for choice in self.votes.values():
+            self.vote_counts[choice] = self.vote_counts.get(choice, 0) + 1
+        self.team_stats = data.get("team_stats") or _empty_team_stats()
+        self.paused_remaining = data.get("paused_remaining")
+        self.paused_elapsed = data.get("paused_elapsed")
+        self.dropped_players = set(data.get("dropped_players", []))
+
+    def approx_bytes(self) -> int:
+        """Примерный объем игры в памяти: слоты, тексты вопросов, игроки и голоса."""
+        size = sys.getsizeof(self) + sys.getsizeof(self.questions) + sys.getsizeof(self.players)
+        for question in self.questions.values():
+            size += sys.getsizeof(question) + sys.getsizeof(question.text)
+            size += sum(sys.getsizeof(option) for option in question.options)
+        for player in self.players.values():
+            size += sys.getsizeof(player) + sys.getsizeof(player.name)
+        return size + sys.getsizeof(self.votes) + sys.getsizeof(self.vote_counts) + sys.getsizeof(self.team_stats)
+
+    def mark_player(self, player: PlayerSlot) -> None:
+        self.dirty_players.add(player.id)
+
+    def mark_question(self, question: QuestionSlot) -> None:
+        self.dirty_questions.add(question.id)
+
+    def take_changes(self) -> dict:
+        """Снимает накопленные изменения в виде простых словарей для записи вне event loop."""
+        changes = {
+            "game_id": self.id,
+            "game": {field: getattr(self, field) for field in GAME_FIELDS},
+            "players": [
+                {"id": p.id, "team": p.team, "is_captain": p.is_captain, "active": p.active}
+                for p in (self.players.get(pid) for pid in self.dirty_players)
+                if p is not None
+            ],
+            "questions": [],
+            "answered": None,
+        }
+        if self.compact_questions:
+            if self.dirty_questions:
+                ordered = sorted(self.questions.values(), key=lambda q: q.id)
+                changes["answered"] = "".join("1" if q.answered else "0" for q in ordered)
+        else:
+            changes["questions"] = [{"id": qid, "answered": True} for qid in self.dirty_questions]
+        self.dirty = False
+        self.dirty_players = set()
+        self.dirty_questions = set()
+        return changes
+
+    def restore_changes(self, changes: dict) -> None:
+        """Возвращает изменения, которые не удалось записать: их допишет следующая запись."""
+        self.dirty = True
+        self.dirty_players.update(p["id"] for p in changes["players"])
+        self.dirty_questions.update(q["id"] for q in changes["questions"])
+        if changes["answered"] is not None:
+            self.dirty_questions.update(q.id for q in self.questions.values() if q.answered)
+
+
+def encode_changes(changes: dict) -> dict:
+    """Изменения из take_changes в виде, пригодном для JSON-снимка."""
+    started_at = changes["game"]["question_started_at"]
+    return {
+        **changes,
+        "game": {**changes["game"], "question_started_at": started_at.isoformat() if started_at else None},
+    }
+
+
+def decode_changes(data: dict) -> dict:
+    started_at = data["game"]["question_started_at"]
+    return {
+        **data,
+        "game": {**data["game"], "question_started_at": datetime.fromisoformat(started_at) if started_at else None},
+    }
+
+
+def persist_changes(db: Session, changes: dict) -> None:
+    """Записывает изменения, снятые take_changes, одной транзакцией."""
+    db.query(Game).filter(Game.id == changes["game_id"]).update(changes["game"], synchronize_session=False)
+    if changes["players"]:
+        db.bulk_update_mappings(Player, changes["players"])
+    if changes["questions"]:
+        db.bulk_update_mappings(Question, changes["questions"])
+    if changes.get("answered") is not None:
+        db.execute(
+            update(QuestionSet).where(QuestionSet.game_id == changes["game_id"]).values(answered=changes["answered"])
+        )
+    db.commit()
@@ -1,16 +1,23 @@
 """Сервис игры."""
 
 import asyncio
+import json
+import math
+import os
 import random
-import string
+import time
+import weakref
 from collections import Counter, defaultdict
+from functools import partial
 from datetime import datetime, timedelta, timezone
+from typing import Callable
 
 from fastapi import HTTPException, WebSocket
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from app.database import SessionLocal
-from app.models import Game, Player, Question, User
+from app.database import SessionLocal, run_db
+from app.models import Game, Player, User
 from app.schemas import (
     GameStateOut,
     PlayerOut,
@@ -21,201 +28,820 @@ from app.schemas import (
     TeamStats,
     UserProfileStatsResponse,
 )
-from app.services.ai_service import generate_questions
+from app.services.ai_service import generate_questions_async
+from app.services.broadcast_bus import BroadcastBus, InProcessBus
+from app.services.game_mailbox import Action, GameMailboxes
+from app.services.game_runtime import (
+    GameRuntime,
+    PlayerSlot,
+    decode_changes,
+    encode_changes,
+    persist_changes,
+    store_questions,
+)
+from app.services.pin_registry import PinRegistry
+from app.services.question_pool import QuestionPool
+from app.services.timer_wheel import create_timer_wheel
+from app.services.wire_format import WIRE_MSGPACK, packb
 
 BASE_QUESTION_TIMEOUT = {"easy": 25, "medium": 25, "hard": 25}
+COUNTDOWN_SECONDS = 3
+WS_SEND_QUEUE_SIZE = int(os.getenv("QUIZBATTLE_WS_SEND_QUEUE", "32"))
+WS_SEND_TIMEOUT = float(os.getenv("QUIZBATTLE_WS_SEND_TIMEOUT", "10"))
+WS_HEARTBEAT_INTERVAL = float(os.getenv("QUIZBATTLE_WS_HEARTBEAT_INTERVAL", "15"))
+WS_IDLE_TIMEOUT = float(os.getenv("QUIZBATTLE_WS_IDLE_TIMEOUT", "45"))
+BROADCAST_COALESCE_SECONDS = int(os.getenv("QUIZBATTLE_BROADCAST_COALESCE_MS", "150")) / 1000
+GAME_REAP_INTERVAL = float(os.getenv("QUIZBATTLE_GAME_REAP_INTERVAL", "60"))
+FINISHED_GAME_TTL = float(os.getenv("QUIZBATTLE_FINISHED_GAME_TTL", "600"))
+IDLE_LOBBY_TTL = float(os.getenv("QUIZBATTLE_IDLE_LOBBY_TTL", "1800"))
+PIN_POOL_SIZE = int(os.getenv("QUIZBATTLE_PIN_POOL_SIZE", "64"))
+PIN_ALLOCATION_ATTEMPTS = 5
+SNAPSHOT_PATH = os.getenv("QUIZBATTLE_SNAPSHOT_PATH", "quizbattle-runtime.json")
+SNAPSHOT_INTERVAL = float(os.getenv("QUIZBATTLE_SNAPSHOT_INTERVAL", "0"))
+FLUSH_RETRY_MIN = 0.5
+FLUSH_RETRY_MAX = 30.0
+FLUSH_DRAIN_TIMEOUT = float(os.getenv("QUIZBATTLE_FLUSH_DRAIN_TIMEOUT", "10"))
+# Код закрытия выгруженной комнаты: клиент не переподключается, иначе вернул бы игру в память.
+WS_CLOSE_ROOM_EVICTED = 4001
+
+
+def _dump_json(payload: dict) -> str:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+def _merge_patch(old: dict, new: dict) -> dict:
+    """Разница двух состояний в формате JSON Merge Patch (RFC 7386): null удаляет ключ."""
+    patch: dict = {}
+    for key, value in new.items():
+        prev = old.get(key)
+        if isinstance(value, dict) and isinstance(prev, dict):
+            nested = _merge_patch(prev, value)
+            if nested:
+                patch[key] = nested
+        elif key not in old or value != prev:
+            patch[key] = value
+    for key in old.keys() - new.keys():
+        patch[key] = None
+    return patch
+
+
+class _Frames:
+    """Бинарные копии кадров одной рассылки: MessagePack кодируется один раз на кадр."""
+
+    __slots__ = ("_packed", "binary_count")
 
-
-class ConnectionManager:
     def __init__(self) -> None:
-        self.connections: dict[str, set[WebSocket]] = defaultdict(set)
+        self._packed: dict[int, bytes] = {}
+        self.binary_count = 0
+
+    def get(self, text: str, binary: bool) -> str | bytes:
+        if not binary:
+            return text
+        frame = self._packed.get(id(text))
+        if frame is None:
+            frame = self._packed[id(text)] = packb(json.loads(text))
+        self.binary_count += 1
+        return frame
 
-    async def connect(self, game_pin: str, websocket: WebSocket) -> None:
-        await websocket.accept()
-        self.connections[game_pin].add(websocket)
+
+class _Connection:
+    """Сокет игрока с собственной очередью исходящих сообщений."""
+
+    __slots__ = ("websocket", "queue", "writer", "handler", "player_id", "last_seen", "delta", "binary", "state_seq")
+
+    def __init__(
+            self,
+            websocket: WebSocket,
+            queue_size: int,
+            player_id: int | None = None,
+            delta: bool = False,
+            binary: bool = False,
+    ) -> None:
+        self.websocket = websocket
+        self.queue: asyncio.Queue[str | bytes] = asyncio.Queue(maxsize=queue_size)
+        self.writer: asyncio.Task | None = None
+        self.handler: asyncio.Task | None = None
+        self.player_id = player_id
+        self.last_seen = time.monotonic()
+        self.delta = delta
+        self.binary = binary
+        self.state_seq = 0
+
+
+class ConnectionManager:
+    """
+    Рассылка по WebSocket без блокировки на медленных клиентах.
+
+    У каждого соединения своя ограниченная очередь и задача-писатель:
+    broadcast только кладет готовый текст в очереди. Клиент, который не
+    успевает разбирать очередь или не отвечает на отправку дольше
+    WS_SEND_TIMEOUT, отключается — при переподключении он получит
+    актуальное состояние целиком.
+
+    Сервер сам шлет ping сокетам, от которых давно ничего не приходило.
+    Соединения, молчащие дольше idle_timeout (полуоткрытые TCP), закрывает
+    фоновый reaper: обработчик сокета отменяется, а игрок снимается через
+    on_reap.
+    """
+
+    def __init__(
+            self,
+            queue_size: int = WS_SEND_QUEUE_SIZE,
+            send_timeout: float = WS_SEND_TIMEOUT,
+            bus: BroadcastBus | None = None,
+            heartbeat_interval: float = WS_HEARTBEAT_INTERVAL,
+            idle_timeout: float = WS_IDLE_TIMEOUT,
+    ) -> None:
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.bus = bus or InProcessBus()
+        self.bus.bind(self._deliver)
+        self.connections: dict[str, dict[WebSocket, _Connection]] = defaultdict(dict)
+        self.counters: Counter = Counter()
+        self.on_reap: Callable[[str, int], None] | None = None
+        self._reaped: weakref.WeakSet[WebSocket] = weakref.WeakSet()
+        self._reaper: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        await self.bus.start()
+        self._reaper = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self) -> None:
+        if self._reaper:
+            self._reaper.cancel()
+            self._reaper = None
+        await self.bus.stop()
+
+    async def connect(
+            self,
+            game_pin: str,
+            websocket: WebSocket,
+            player_id: int | None = None,
+            delta: bool = False,
+            subprotocol: str | None = None,
+    ) -> None:
+        await websocket.accept(subprotocol=subprotocol)
+        conn = _Connection(websocket, self.queue_size, player_id=player_id, delta=delta, binary=subprotocol == WIRE_MSGPACK)
+        conn.handler = asyncio.current_task()
+        conn.writer = asyncio.create_task(self._writer(game_pin, conn))
+        self.connections[game_pin][websocket] = conn
+        self.counters["connected"] += 1
 
     def disconnect(self, game_pin: str, websocket: WebSocket) -> None:
-        if game_pin in self.connections:
-            self.connections[game_pin].discard(websocket)
-            if not self.connections[game_pin]:
-                self.connections.pop(game_pin, None)
+        conns = self.connections.get(game_pin)
+        if conns is None:
+            return
+        conn = conns.pop(websocket, None)
+        if not conns:
+            self.connections.pop(game_pin, None)
+        if conn and conn.writer and conn.writer is not asyncio.current_task():
+            conn.writer.cancel()
 
-    async def broadcast(self, game_pin: str, payload: dict) -> None:
-        sockets = list(self.connections.get(game_pin, set()))
-        for ws in sockets:
+    def mark_alive(self, game_pin: str, websocket: WebSocket) -> None:
+        conn = self.connections.get(game_pin, {}).get(websocket)
+        if conn:
+            conn.last_seen = time.monotonic()
+
+    def was_reaped(self, websocket: WebSocket) -> bool:
+        return websocket in self._reaped
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
             try:
-                await ws.send_json(payload)
+                self._heartbeat()
             except Exception:
-                self.disconnect(game_pin, ws)
+                self.counters["reaper_errors"] += 1
+
+    def _heartbeat(self) -> None:
+        now = time.monotonic()
+        ping = _dump_json({"type": "ping"})
+        for game_pin, conns in list(self.connections.items()):
+            for conn in list(conns.values()):
+                idle = now - conn.last_seen
+                if idle >= self.idle_timeout:
+                    self._reap(game_pin, conn)
+                elif idle >= self.heartbeat_interval:
+                    self._enqueue(game_pin, conn, packb({"type": "ping"}) if conn.binary else ping)
+                    self.counters["heartbeats"] += 1
+
+    def _reap(self, game_pin: str, conn: _Connection) -> None:
+        self.counters["reaped"] += 1
+        self._reaped.add(conn.websocket)
+        self._drop(game_pin, conn, code=1001)
+        if conn.handler and not conn.handler.done():
+            conn.handler.cancel()
+        if self.on_reap and conn.player_id is not None:
+            # Без ожидания: занятый ящик одной игры не должен задерживать пинги всего сервера.
+            self.on_reap(game_pin, conn.player_id)
+
+    def close_room(self, game_pin: str, code: int = 1001) -> int:
+        """Закрывает все сокеты комнаты; обработчики отменяются, как при reap, но игроки не снимаются."""
+        conns = list(self.connections.get(game_pin, {}).values())
+        for conn in conns:
+            self._reaped.add(conn.websocket)
+            self._drop(game_pin, conn, code=code)
+            if conn.handler and not conn.handler.done() and conn.handler is not asyncio.current_task():
+                conn.handler.cancel()
+        self.counters["room_sockets_closed"] += len(conns)
+        return len(conns)
+
+    def _enqueue(self, game_pin: str, conn: _Connection, frame: str | bytes) -> None:
+        try:
+            conn.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.counters["dropped_slow"] += 1
+            self._drop(game_pin, conn, code=1013)
+
+    def _drop(self, game_pin: str, conn: _Connection, code: int) -> None:
+        self.disconnect(game_pin, conn.websocket)
+        asyncio.create_task(self._close(conn.websocket, code))
+
+    async def _close(self, websocket: WebSocket, code: int) -> None:
+        try:
+            await asyncio.wait_for(websocket.close(code=code), timeout=self.send_timeout)
+        except Exception:
+            pass
+
+    async def _writer(self, game_pin: str, conn: _Connection) -> None:
+        while True:
+            frame = await conn.queue.get()
+            send = conn.websocket.send_bytes(frame) if isinstance(frame, bytes) else conn.websocket.send_text(frame)
+            try:
+                await asyncio.wait_for(send, timeout=self.send_timeout)
+            except asyncio.TimeoutError:
+                self.counters["dropped_timeout"] += 1
+                self._drop(game_pin, conn, code=1013)
+                return
+            except Exception:
+                self.counters["send_errors"] += 1
+                self.disconnect(game_pin, conn.websocket)
+                return
+            self.counters["sent"] += 1
+
+    async def send(self, game_pin: str, websocket: WebSocket, payload: dict) -> None:
+        conn = self.connections.get(game_pin, {}).get(websocket)
+        if conn:
+            self._enqueue(game_pin, conn, packb(payload) if conn.binary else _dump_json(payload))
+
+    async def send_snapshot(self, game_pin: str, websocket: WebSocket, full_text: str) -> None:
+        """Полный снимок одному сокету; следующая рассылка ему тоже уйдет целиком."""
+        conn = self.connections.get(game_pin, {}).get(websocket)
+        if conn:
+            conn.state_seq = 0
+            self._enqueue(game_pin, conn, packb(json.loads(full_text)) if conn.binary else full_text)
+            self.counters["full_frames"] += 1
+
+    async def broadcast_state(self, game_pin: str, seq: int, full_text: str, patch_text: str | None, base_seq: int) -> None:
+        """
+        Публикует версию состояния seq в шину — она дойдет до сокетов всех воркеров.
+
+        Клиенты в режиме delta, у которых последней была версия base_seq,
+        получают патч; остальные — полный снимок.
+        """
+        await self.bus.publish(
+            {"pin": game_pin, "kind": "state", "seq": seq, "base": base_seq, "full": full_text, "patch": patch_text}
+        )
+
+    async def _deliver(self, message: dict) -> None:
+        if message["kind"] == "state":
+            self._fan_out_state(message["pin"], message["seq"], message["full"], message["patch"], message["base"])
+        else:
+            self._fan_out_text(message["pin"], message["text"])
+
+    def _fan_out_state(self, game_pin: str, seq: int, full_text: str, patch_text: str | None, base_seq: int) -> None:
+        frames = _Frames()
+        for conn in list(self.connections.get(game_pin, {}).values()):
+            if conn.delta and patch_text is not None and conn.state_seq == base_seq:
+                self._enqueue(game_pin, conn, frames.get(patch_text, conn.binary))
+                self.counters["patch_frames"] += 1
+            else:
+                self._enqueue(game_pin, conn, frames.get(full_text, conn.binary))
+                self.counters["full_frames"] += 1
+            conn.state_seq = seq
+        self.counters["broadcasts"] += 1
+        self.counters["binary_frames"] += frames.binary_count
+
+    async def broadcast(self, game_pin: str, payload: dict) -> None:
+        await self.broadcast_text(game_pin, _dump_json(payload))
+
+    async def broadcast_text(self, game_pin: str, text: str) -> None:
+        await self.bus.publish({"pin": game_pin, "kind": "text", "text": text})
+
+    def _fan_out_text(self, game_pin: str, text: str) -> None:
+        frames = _Frames()
+        for conn in list(self.connections.get(game_pin, {}).values()):
+            self._enqueue(game_pin, conn, frames.get(text, conn.binary))
+        self.counters["broadcasts"] += 1
+
+    def stats(self) -> dict:
+        depths = [conn.queue.qsize() for conns in self.connections.values() for conn in conns.values()]
+        return {
+            "rooms": len(self.connections),
+            "connections": len(depths),
+            "queued_messages": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "queue_size": self.queue_size,
+            "idle_timeout": self.idle_timeout,
+            **{
+                key: self.counters[key]
+                for key in (
+                    "connected", "broadcasts", "sent", "full_frames", "patch_frames", "binary_frames",
+                    "dropped_slow", "dropped_timeout", "send_errors", "heartbeats", "reaped", "reaper_errors",
+                    "room_sockets_closed",
+                )
+            },
+            "bus": self.bus.stats(),
+        }
 
 
 class GameService:
     def __init__(self) -> None:
         self.manager = ConnectionManager()
-        self.timer_tasks: dict[str, asyncio.Task] = {}
-        self.votes: dict[str, dict[int, str]] = defaultdict(dict)
-        self.team_stats: dict[str, dict[str, dict[str, int]]] = defaultdict(
-            lambda: {
-                "A": {"correct": 0, "incorrect": 0, "timeout": 0, "speed_bonus": 0},
-                "B": {"correct": 0, "incorrect": 0, "timeout": 0, "speed_bonus": 0},
-            }
-        )
-        self.paused_remaining: dict[str, int] = {}
-        self.paused_elapsed: dict[str, int] = {}
+        self.manager.on_reap = self._remove_reaped_player
+        self.timers = create_timer_wheel()
+        self.pins = PinRegistry(PIN_POOL_SIZE)
+        self.question_pool = QuestionPool()
+        self.mailboxes = GameMailboxes()
+        self.mailboxes.on_batch_start = self._begin_batch
+        self.mailboxes.on_batch_end = self._end_batch
+        self._batching: set[str] = set()
+        self._deferred_broadcasts: set[str] = set()
+        self.runtimes: dict[str, GameRuntime] = {}
+        self._pending_broadcasts: dict[str, asyncio.Task] = {}
+        self.state_versions: dict[str, int] = defaultdict(int)
+        self._state_cache: dict[str, tuple[tuple[int, int | None], str, dict]] = {}
+        self._last_broadcast: dict[str, tuple[int, dict]] = {}
+        self.counters: Counter = Counter()
+        self._snapshot_task: asyncio.Task | None = None
+        self._reaper_task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        """Запуск процесса: восстанавливает идущие игры и включает фоновые задачи."""
+        await self.manager.start()
+        db = SessionLocal()
+        try:
+            self.pins.load(db)
+            self.question_pool.load(db)
+            restored = self.restore_runtime(db, self._read_snapshot())
+        finally:
+            db.close()
+        self._consume_snapshot()
+        if restored:
+            print(f"♻️ Восстановлено игр: {restored}")
+        if SNAPSHOT_INTERVAL > 0:
+            self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+        self._reaper_task = asyncio.create_task(self._reap_loop())
+        self.question_pool.start()
+
+    async def stop(self) -> None:
+        """
+        Остановка процесса: дописывает изменения в БД и сохраняет снимок.
+
+        Изменения, которые не удалось записать за FLUSH_DRAIN_TIMEOUT, уходят
+        в снимок и применяются к БД при следующем запуске.
+        """
+        for task in (self._snapshot_task, self._reaper_task):
+            if task is not None:
+                task.cancel()
+        self._snapshot_task = self._reaper_task = None
+        self.question_pool.stop()
+        for game in self.runtimes.values():
+            if game.questions_task and not game.questions_task.done():
+                game.questions_task.cancel()
+        await self._drain_flushes()
+        snapshot = self.snapshot_runtime()
+        unsaved = {pin: encode_changes(game.take_changes()) for pin, game in self.runtimes.items() if game.dirty}
+        if unsaved:
+            snapshot["unsaved"] = unsaved
+            print(f"⚠️ Не записаны в БД игры {', '.join(unsaved)}: изменения сохранены в снимке")
+        self._write_snapshot(snapshot)
+        await self.manager.stop()
+        await self.timers.stop()
+
+    async def _drain_flushes(self) -> None:
+        pending = [g.flush_task for g in self.runtimes.values() if g.flush_task and not g.flush_task.done()]
+        if not pending:
+            return
+        _, stuck = await asyncio.wait(pending, timeout=FLUSH_DRAIN_TIMEOUT)
+        # Запись, которая так и не прошла, прерываем: ее изменения вернутся в игру и попадут в снимок.
+        for task in stuck:
+            task.cancel()
+        await asyncio.gather(*stuck, return_exceptions=True)
 
-    def generate_pin(self, db: Session) -> str:
-        alphabet = string.ascii_uppercase + string.digits
+    async def _snapshot_loop(self) -> None:
         while True:
-            pin = "".join(random.choices(alphabet, k=6))
-            if not db.query(Game).filter(Game.pin == pin, Game.status != "finished").first():
-                return pin
+            await asyncio.sleep(SNAPSHOT_INTERVAL)
+            await asyncio.to_thread(self._write_snapshot, self.snapshot_runtime())
 
-    def create_game(
+    async def _reap_loop(self) -> None:
+        while True:
+            await asyncio.sleep(GAME_REAP_INTERVAL)
+            try:
+                self.reap_games()
+            except Exception as exc:
+                self.counters["reap_errors"] += 1
+                print(f"❌ Ошибка очистки игр: {exc}")
+
+    def reap_games(self, now: float | None = None) -> int:
+        """
+        Выгружает из памяти завершенные игры и заброшенные лобби.
+
+        Игра считается простаивающей, если ее состояние не менялось дольше
+        TTL: FINISHED_GAME_TTL для завершенных, IDLE_LOBBY_TTL для лобби.
+        Брошенное лобби сначала завершается и освобождает PIN, а выгружается
+        на следующем проходе, когда статус записан в БД. Идущие игры не
+        трогаем — их доведет до конца таймер вопросов.
+        """
+        now = time.monotonic() if now is None else now
+        evicted = 0
+        for pin, game in list(self.runtimes.items()):
+            idle = now - game.last_activity
+            if game.status == "finished" and idle >= FINISHED_GAME_TTL:
+                evicted += self.evict_game(pin)
+            elif game.status == "waiting" and idle >= IDLE_LOBBY_TTL:
+                self.mailboxes.post(pin, lambda pin=pin: self._abandon_lobby(pin))
+        return evicted
+
+    async def _abandon_lobby(self, pin: str) -> None:
+        game = self.runtimes.get(pin)
+        if game is None or game.status != "waiting":
+            return
+        game.status = "finished"
+        self.pins.remove(pin, game.id)
+        self._schedule_flush(game)
+        self.counters["abandoned"] += 1
+
+    def evict_game(self, pin: str) -> bool:
+        """Снимает таймер, закрывает сокеты и удаляет все структуры игры из памяти."""
+        game = self.runtimes.get(pin)
+        if game is None or game.dirty or (game.flush_task and not game.flush_task.done()):
+            return False
+        self._discard_runtime(pin, game)
+        self.counters["evicted"] += 1
+        return True
+
+    def _discard_runtime(self, pin: str, game: GameRuntime) -> None:
+        self.timers.cancel(pin)
+        if game.questions_task and not game.questions_task.done():
+            game.questions_task.cancel()
+        pending = self._pending_broadcasts.pop(pin, None)
+        if pending:
+            pending.cancel()
+        self.manager.close_room(pin, code=WS_CLOSE_ROOM_EVICTED)
+        self.mailboxes.close(pin)
+        del self.runtimes[pin]
+        self.state_versions.pop(pin, None)
+        self._state_cache.pop(pin, None)
+        self._last_broadcast.pop(pin, None)
+
+    def stats(self) -> dict:
+        resident = len(self.runtimes)
+        approx_bytes = sum(
+            game.approx_bytes() + len(self._state_cache.get(pin, (None, ""))[1])
+            for pin, game in self.runtimes.items()
+        )
+        return {
+            "resident": resident,
+            "by_status": dict(Counter(game.status for game in self.runtimes.values())),
+            "approx_bytes": approx_bytes,
+            "approx_bytes_per_game": approx_bytes // resident if resident else 0,
+            **self.counters,
+        }
+
+    def snapshot_runtime(self) -> dict:
+        """Снимок состояния идущих игр, которого нет в БД: голоса, статистика, пауза, таймеры."""
+        return {
+            "saved_at": time.time(),
+            "games": {
+                pin: game.snapshot(self.timers.remaining(pin))
+                for pin, game in self.runtimes.items()
+                if game.status == "in_progress"
+            },
+        }
+
+    def _write_snapshot(self, data: dict) -> None:
+        tmp_path = f"{SNAPSHOT_PATH}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            fh.write(_dump_json(data))
+        os.replace(tmp_path, SNAPSHOT_PATH)
+
+    def _read_snapshot(self) -> dict:
+        try:
+            with open(SNAPSHOT_PATH, encoding="utf-8") as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as exc:
+            print(f"❌ Не удалось прочитать снимок игр: {exc}")
+            return {}
+
+    def _consume_snapshot(self) -> None:
+        """Удаляет примененный снимок: после сбоя он вернул бы устаревшие раунды и изменения поверх БД."""
+        try:
+            os.remove(SNAPSHOT_PATH)
+        except FileNotFoundError:
+            pass
+        except OSError as exc:
+            print(f"❌ Не удалось удалить снимок игр: {exc}")
+
+    def restore_runtime(self, db: Session, snapshot: dict) -> int:
+        """
+        Поднимает в память все идущие игры и заново ставит их таймеры.
+
+        Состояние раунда берется из снимка, если он есть. Время простоя
+        не засчитывается: таймер вопроса продолжается с сохраненного остатка.
+        """
+        saved = snapshot.get("games", {})
+        # Сначала дописываем изменения, не попавшие в БД при прошлой остановке, —
+        # иначе завершенная игра поднялась бы как идущая.
+        for pin, changes in snapshot.get("unsaved", {}).items():
+            persist_changes(db, decode_changes(changes))
+            print(f"💾 Дописаны изменения игры {pin} из снимка")
+        games = db.query(Game).filter(Game.status == "in_progress").all()
+        for row in games:
+            game = GameRuntime.load(db, row)
+            entry = saved.get(game.pin)
+            timer_left = None
+            if entry and entry.get("id") == game.id:
+                game.restore(entry)
+                timer_left = entry.get("timer_left")
+            self.runtimes[game.pin] = game
+            self.touch_state(game.pin)
+            self._rearm_timer(game, timer_left)
+        return len(games)
+
+    def _rearm_timer(self, game: GameRuntime, timer_left: float | None) -> None:
+        now = datetime.now(timezone.utc)
+        timeout_seconds = BASE_QUESTION_TIMEOUT.get(game.difficulty, 30)
+        if game.phase == "countdown":
+            left = COUNTDOWN_SECONDS if timer_left is None else timer_left
+            game.phase_deadline = now + timedelta(seconds=left)
+            self.timers.schedule(game.pin, left, lambda: self.dispatch(game.pin, lambda: self._open_first_question(game.pin)))
+        elif game.phase == "question":
+            if timer_left is None:
+                timer_left = self._question_seconds_left(game) or 0
+            left = max(1, math.ceil(timer_left))
+            game.question_started_at = now - timedelta(seconds=max(0, timeout_seconds - left))
+            self.start_timer(game.pin, game.difficulty, remaining_seconds=left)
+        elif game.phase == "paused" and game.paused_remaining is None:
+            game.paused_elapsed = 0
+            game.paused_remaining = timeout_seconds
+
+    async def _questions_for_game(self, topic: str, difficulty: str, count: int) -> list[dict]:
+        """Вопросы из пула, а при промахе — живая генерация."""
+        pooled = await self.question_pool.take(topic, difficulty, count)
+        if pooled is not None:
+            return pooled
+        return await generate_questions_async(topic, count, difficulty=difficulty)
+
+    def _generate_questions(self, game: GameRuntime, replace: bool = True) -> None:
+        """
+        Запускает фоновую генерацию вопросов для текущей темы и сложности игры.
+
+        replace=False — у игры еще нет строк вопросов в БД (только что создана).
+        """
+        game.questions_ready = False
+        game.questions_task = asyncio.create_task(self._fill_questions(game, game.topic, game.difficulty, replace))
+
+    async def _fill_questions(self, game: GameRuntime, topic: str, difficulty: str, replace: bool) -> None:
+        started = time.perf_counter()
+        try:
+            generated = await self._questions_for_game(topic, difficulty, game.questions_per_team * 2)
+            if self.runtimes.get(game.pin) is not game:
+                return
+            # Перемешиваем, чтобы распределение было случайным
+            random.shuffle(generated)
+            questions, compact = await run_db(
+                store_questions, game.id, game.questions_per_team, generated, replace
+            )
+        except Exception as exc:
+            self.counters["question_job_errors"] += 1
+            print(f"❌ Не удалось подготовить вопросы игры {game.pin}: {exc}")
+            return
+        game.set_questions(questions, compact)
+        self.counters["question_jobs"] += 1
+        self.counters["question_job_ms"] += int((time.perf_counter() - started) * 1000)
+        await self.broadcast_state(None, game)
+
+    async def _wait_questions(self, game: GameRuntime) -> None:
+        """
+        Дожидается фоновой генерации вопросов перед стартом.
+
+        Если задачи нет — игра поднята из БД после перезапуска или генерация
+        упала, — она запускается заново.
+        """
+        if game.questions_task is None or game.questions_task.done():
+            self._generate_questions(game)
+        self.counters["start_waits"] += 1
+        started = time.perf_counter()
+        # shield: обрыв запроса на старт не должен отменять генерацию.
+        await asyncio.shield(game.questions_task)
+        self.counters["start_wait_ms"] += int((time.perf_counter() - started) * 1000)
+        if not game.questions_ready:
+            raise HTTPException(status_code=503, detail="Не удалось подготовить вопросы, попробуйте еще раз")
+
+    async def create_game(
             self,
-            db: Session,
             host_name: str,
             topic: str,
             questions_per_team: int,
             user_id: int | None,
             difficulty: str = "medium",
             pin: str | None = None,
-    ) -> tuple[Game, Player]:
-        game_pin = pin.upper() if pin else self.generate_pin(db)
-        duplicate_game = (
-            db.query(Game)
-            .filter(Game.pin == game_pin, Game.status != "finished")
-            .first()
-        )
-        if duplicate_game:
+    ) -> tuple[GameRuntime, PlayerSlot]:
+        custom_pin = pin.upper() if pin else None
+        if custom_pin and self.pins.is_active(custom_pin):
             raise HTTPException(status_code=400, detail="Игра с таким кодом уже существует")
 
-        game = Game(pin=game_pin, topic=topic, questions_per_team=questions_per_team, status="waiting",
-                    difficulty=difficulty, phase="gathering")
-        db.add(game)
-        db.flush()
+        runtime = await run_db(self._insert_game, host_name, topic, questions_per_team, user_id, difficulty, custom_pin)
+        previous = self.runtimes.get(runtime.pin)
+        if previous is not None:
+            # PIN достался от завершенной игры: ее сокеты не должны получать состояние новой комнаты.
+            # Несохраненные изменения старой игры допишет ее собственная задача записи.
+            self._discard_runtime(runtime.pin, previous)
+        self.pins.add(runtime.pin, runtime.id)
+        self.runtimes[runtime.pin] = runtime
+        self.touch_state(runtime.pin)
+        # Комната доступна сразу, вопросы готовятся, пока игроки собираются в лобби.
+        self._generate_questions(runtime, replace=False)
+        return runtime, next(iter(runtime.players.values()))
+
+    def _insert_game(
+            self,
+            db: Session,
+            host_name: str,
+            topic: str,
+            questions_per_team: int,
+            user_id: int | None,
+            difficulty: str,
+            custom_pin: str | None,
+    ) -> GameRuntime:
+        """Подбирает PIN и записывает игру с ведущим; выполняется в потоке БД."""
+        for _ in range(PIN_ALLOCATION_ATTEMPTS):
+            game_pin = custom_pin or self.pins.allocate(db)
+            if game_pin is None:
+                break
+            game = Game(pin=game_pin, topic=topic, questions_per_team=questions_per_team, status="waiting",
+                        difficulty=difficulty, phase="gathering", current_index_a=0, current_index_b=0,
+                        score_a=0, score_b=0)
+            db.add(game)
+            try:
+                db.flush()
+                break
+            except IntegrityError:
+                # Код занят в БД незавершенной игрой — например, другого воркера.
+                db.rollback()
+                self.pins.collision()
+                if custom_pin:
+                    raise HTTPException(status_code=400, detail="Игра с таким кодом уже существует")
+        else:
+            game_pin = None
+        if game_pin is None:
+            raise HTTPException(status_code=503, detail="Не удалось подобрать код игры, попробуйте еще раз")
 
         host = Player(game_id=game.id, user_id=user_id, name=host_name, team=None, is_host=True, is_captain=False,
                       active=True)
         db.add(host)
         db.flush()
 
-        # --- ОДИН ЗАПРОС НА ВСЕ КОМАНДЫ ---
-        total_count = questions_per_team * 2
-        all_generated = generate_questions(topic, total_count, difficulty=difficulty)
-
-        # Перемешиваем, чтобы распределение было случайным
-        random.shuffle(all_generated)
-
-        # Распределяем: первые N — команде A, остальные — команде B
-        for i, q_data in enumerate(all_generated):
-            team_label = "A" if i < questions_per_team else "B"
-            order_idx = i if team_label == "A" else i - questions_per_team
-
-            db.add(Question(
-                game_id=game.id,
-                team=team_label,
-                order_index=order_idx,
-                text=q_data["text"],
-                option_1=q_data["options"][0],
-                option_2=q_data["options"][1],
-                option_3=q_data["options"][2],
-                option_4=q_data["options"][3],
-                correct_option=q_data["correct_option"]
-            ))
-        # ----------------------------------
-
-        game_id = game.id
-        host_id = host.id
-
+        runtime = GameRuntime(game, [host], [])
         db.commit()
+        return runtime
 
-        created_game = db.query(Game).filter(Game.id == game_id).first()
-        created_host = db.query(Player).filter(Player.id == host_id).first()
-        if not created_game or not created_host:
-            raise HTTPException(status_code=500, detail="Не удалось создать игру")
-
-        return created_game, created_host
-
-    def _assign_teams_and_captains(self, db: Session, game: Game) -> None:
-        players = db.query(Player).filter(Player.game_id == game.id, Player.active.is_(True)).order_by(Player.joined_at.asc()).all()
+    def _assign_teams_and_captains(self, game: GameRuntime) -> None:
+        players = game.active_players()
         shuffled = players[:]
         random.shuffle(shuffled)
         for idx, player in enumerate(shuffled):
             player.team = "A" if idx % 2 == 0 else "B"
             player.is_captain = False
+            game.mark_player(player)
         for team in ("A", "B"):
             first = next((p for p in players if p.team == team), None)
             if first:
                 first.is_captain = True
-        db.commit()
 
-    def join_game(self, db: Session, pin: str, name: str, user_id: int | None) -> Player:
-        game = db.query(Game).filter(Game.pin == pin).first()
-        if not game:
-            raise HTTPException(status_code=404, detail="Игра не найдена")
+    async def join_game(self, pin: str, name: str, user_id: int | None) -> PlayerSlot:
+        await self.load_game(pin)
+        # Через ящик игры: проверка дубля и запись игрока не пересекаются с другим входом.
+        return await self.dispatch(pin, partial(self._join, pin, name, user_id))
+
+    async def _join(self, pin: str, name: str, user_id: int | None) -> PlayerSlot:
+        game = self.get_game(None, pin)
         if game.status != "waiting":
             raise HTTPException(status_code=400, detail="Игра уже началась")
 
+        active = game.active_players()
         duplicate_player = None
         if user_id is not None:
-            duplicate_player = (
-                db.query(Player)
-                .filter(
-                    Player.game_id == game.id,
-                    Player.active.is_(True),
-                    Player.user_id == user_id,
-                )
-                .first()
-            )
+            duplicate_player = next((p for p in active if p.user_id == user_id), None)
         if duplicate_player is None:
-            duplicate_player = (
-                db.query(Player)
-                .filter(
-                    Player.game_id == game.id,
-                    Player.active.is_(True),
-                    Player.name == name,
-                )
-                .first()
-            )
+            duplicate_player = next((p for p in active if p.name == name), None)
         if duplicate_player:
             raise HTTPException(status_code=400, detail="Вы уже в этой комнате")
 
-        player = Player(game_id=game.id, user_id=user_id, name=name, team=None, is_host=False, is_captain=False, active=True)
+        player = await run_db(self._insert_player, game.id, name, user_id)
+        return game.add_player(player)
+
+    def _insert_player(self, db: Session, game_id: int, name: str, user_id: int | None) -> Player:
+        player = Player(game_id=game_id, user_id=user_id, name=name, team=None, is_host=False, is_captain=False, active=True)
         db.add(player)
         db.commit()
-        db.refresh(player)
         return player
 
-    def get_game(self, db: Session, pin: str) -> Game:
-        game = db.query(Game).filter(Game.pin == pin).first()
+    async def load_game(self, pin: str) -> GameRuntime:
+        """Игра из памяти; при промахе загружается из БД в потоке БД, не блокируя event loop."""
+        runtime = self.runtimes.get(pin)
+        if runtime is not None:
+            return runtime
+        loaded = await run_db(self._load_runtime, pin)
+        # Пока шла загрузка, игру мог поднять другой запрос — оставляем первую.
+        return self.runtimes.setdefault(pin, loaded)
+
+    def _load_runtime(self, db: Session, pin: str) -> GameRuntime:
+        game_id = self.pins.game_id(pin)
+        if game_id is not None:
+            game = db.get(Game, game_id)
+        else:
+            # Не активна в этом процессе: завершенная игра или игра другого воркера.
+            game = db.query(Game).filter(Game.pin == pin).order_by(Game.id.desc()).first()
         if not game:
             raise HTTPException(status_code=404, detail="Игра не найдена")
-        return game
-
-    def get_current_question(self, db: Session, game: Game) -> Question | None:
-        if game.status != "in_progress" or game.phase != "question" or not game.current_team:
-            return None
-        index = game.current_index_a if game.current_team == "A" else game.current_index_b
-        return db.query(Question).filter(Question.game_id == game.id, Question.team == game.current_team, Question.order_index == index).first()
+        return GameRuntime.load(db, game)
+
+    def get_game(self, db: Session | None, pin: str) -> GameRuntime:
+        """
+        Игра из памяти; при первом обращении загружается из БД.
+
+        Корутины заранее поднимают игру через load_game и передают db=None:
+        запросов к БД из event loop не будет.
+        """
+        runtime = self.runtimes.get(pin)
+        if runtime is not None:
+            return runtime
+        if db is None:
+            raise HTTPException(status_code=404, detail="Игра не найдена")
+        runtime = self.runtimes[pin] = self._load_runtime(db, pin)
+        return runtime
+
+    def _schedule_flush(self, game: GameRuntime) -> None:
+        """Отложенная запись изменений игры в SQLite; не блокирует рассылку."""
+        game.dirty = True
+        if game.flush_task is None or game.flush_task.done():
+            game.flush_task = asyncio.create_task(self._flush(game))
+
+    async def _flush(self, game: GameRuntime) -> None:
+        """Пишет изменения, пока они есть; при ошибке возвращает их в игру и повторяет с паузой."""
+        delay = FLUSH_RETRY_MIN
+        while game.dirty:
+            changes = game.take_changes()
+            try:
+                await run_db(persist_changes, changes)
+            except asyncio.CancelledError:
+                game.restore_changes(changes)
+                raise
+            except Exception as exc:
+                game.restore_changes(changes)
+                self.counters["flush_errors"] += 1
+                print(f"❌ Ошибка записи игры {game.pin}, повтор через {delay:.1f} с: {exc}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, FLUSH_RETRY_MAX)
+                continue
+            self.counters["flushes"] += 1
+            delay = FLUSH_RETRY_MIN
 
-    def _vote_percentages(self, db: Session, game: Game) -> dict[str, int]:
-        votes = list(self.votes[game.pin].values())
-        if not votes:
+    def _vote_percentages(self, game: GameRuntime) -> dict[str, int]:
+        counter = game.vote_counts
+        if not counter:
             return {}
-        total = len(votes)
-        counter = Counter(votes)
+        total = sum(counter.values())
         return {key: int((val / total) * 100) for key, val in counter.items()}
 
-    def to_state(self, db: Session, game: Game) -> GameStateOut:
-        players = db.query(Player).filter(Player.game_id == game.id, Player.active.is_(True)).order_by(Player.joined_at.asc()).all()
-        current_question = self.get_current_question(db, game)
-        question_seconds_left = None
-        if game.status == "in_progress":
-            if game.phase == "question" and game.question_started_at:
-                elapsed = max(0, int((datetime.now(timezone.utc) - game.question_started_at.replace(tzinfo=timezone.utc)).total_seconds()))
-                question_seconds_left = max(0, BASE_QUESTION_TIMEOUT.get(game.difficulty, 30) - elapsed)
-            elif game.phase == "paused":
-                question_seconds_left = self.paused_remaining.get(game.pin)
+    def _reset_votes(self, game: GameRuntime) -> None:
+        game.votes = {}
+        game.vote_counts = {}
+
+    def _countdown_seconds_left(self, game: GameRuntime) -> int:
+        if game.phase != "countdown" or not game.phase_deadline:
+            return 0
+        return max(0, math.ceil((game.phase_deadline - datetime.now(timezone.utc)).total_seconds()))
+
+    def _question_seconds_left(self, game: GameRuntime) -> int | None:
+        if game.status != "in_progress":
+            return None
+        if game.phase == "question" and game.question_started_at:
+            elapsed = max(0, int((datetime.now(timezone.utc) - game.question_started_at).total_seconds()))
+            return max(0, BASE_QUESTION_TIMEOUT.get(game.difficulty, 30) - elapsed)
+        if game.phase == "paused":
+            return game.paused_remaining
+        return None
+
+    def to_state(self, db: Session, game: GameRuntime) -> GameStateOut:
+        current_question = game.current_question()
+        question_seconds_left = self._question_seconds_left(game)
 
         winner = None
         if game.status == "finished":
@@ -226,51 +852,160 @@ class GameService:
             difficulty=game.difficulty,
             status=game.status,
             phase=game.phase,
-            countdown_seconds=0,
+            countdown_seconds=self._countdown_seconds_left(game),
+            phase_deadline=game.phase_deadline,
+            questions_ready=game.questions_ready,
             questions_per_team=game.questions_per_team,
             current_team=game.current_team,
             score_a=game.score_a,
             score_b=game.score_b,
-            current_question=QuestionPublic(id=current_question.id, team=current_question.team, order_index=current_question.order_index, text=current_question.text, options=[current_question.option_1, current_question.option_2, current_question.option_3, current_question.option_4]) if current_question else None,
-            players=[PlayerOut(id=p.id, name=p.name, team=p.team, is_host=p.is_host, is_captain=p.is_captain) for p in players],
+            current_question=QuestionPublic(id=current_question.id, team=current_question.team, order_index=current_question.order_index, text=current_question.text, options=current_question.options) if current_question else None,
+            players=[PlayerOut(id=p.id, name=p.name, team=p.team, is_host=p.is_host, is_captain=p.is_captain) for p in game.active_players()],
             winner=winner,
             team_stats={
-                "A": TeamStats(**self.team_stats[game.pin]["A"]),
-                "B": TeamStats(**self.team_stats[game.pin]["B"]),
+                "A": TeamStats(**game.team_stats["A"]),
+                "B": TeamStats(**game.team_stats["B"]),
             },
-            vote_percentages=self._vote_percentages(db, game),
+            vote_percentages=self._vote_percentages(game),
             question_seconds_left=question_seconds_left,
         )
 
-    async def broadcast_state(self, db: Session, game: Game) -> None:
-        await self.manager.broadcast(game.pin, {"type": "state", "data": self.to_state(db, game).model_dump()})
-
-    async def start_game(self, db: Session, pin: str, host_player_id: int) -> Game:
-        game = self.get_game(db, pin)
-        host = db.query(Player).filter(Player.id == host_player_id, Player.game_id == game.id, Player.active.is_(True)).first()
+    def state_json(self, db: Session, game: GameRuntime) -> str:
+        """
+        JSON состояния игры, собранный один раз на версию.
+
+        Кэш общий для WebSocket-рассылки и HTTP-ответов. Ключ включает
+        оставшиеся секунды вопроса и отсчета, поэтому таймер в ответе не устаревает.
+        """
+        return self._state_snapshot(game)[0]
+
+    def _state_snapshot(self, game: GameRuntime) -> tuple[str, dict]:
+        key = (self.state_versions[game.pin], self._question_seconds_left(game), self._countdown_seconds_left(game))
+        cached = self._state_cache.get(game.pin)
+        if cached and cached[0] == key:
+            return cached[1], cached[2]
+        data = self.to_state(None, game).model_dump(mode="json")
+        encoded = _dump_json(data)
+        self._state_cache[game.pin] = (key, encoded, data)
+        return encoded, data
+
+    def touch_state(self, pin: str) -> int:
+        """Отмечает изменение состояния игры и возвращает новую версию."""
+        self.state_versions[pin] += 1
+        game = self.runtimes.get(pin)
+        if game is not None:
+            game.last_activity = time.monotonic()
+        return self.state_versions[pin]
+
+    async def dispatch(self, pin: str, action: Action):
+        """Выполняет действие над игрой через ее почтовый ящик — строго по очереди."""
+        return await self.mailboxes.call(pin, action)
+
+    def _begin_batch(self, pin: str) -> None:
+        self._batching.add(pin)
+
+    async def _end_batch(self, pin: str) -> None:
+        self._batching.discard(pin)
+        if pin in self._deferred_broadcasts:
+            self._deferred_broadcasts.discard(pin)
+            game = self.runtimes.get(pin)
+            if game:
+                await self._publish_state(game)
+
+    async def broadcast_state(self, db: Session, game: GameRuntime) -> None:
+        """
+        Рассылает состояние сразу после изменения; отложенная рассылка этой игры отменяется.
+
+        Внутри пачки действий из почтового ящика рассылка откладывается до
+        конца пачки — одна на все действия.
+        """
+        self.touch_state(game.pin)
+        if game.pin in self._batching:
+            self._deferred_broadcasts.add(game.pin)
+            return
+        await self._publish_state(game)
+
+    def schedule_broadcast(self, pin: str) -> None:
+        """
+        Отмечает изменение и откладывает рассылку на BROADCAST_COALESCE_SECONDS.
+
+        Все изменения внутри окна (голоса, подключения) уходят одной рассылкой.
+        """
+        self.touch_state(pin)
+        if pin not in self._pending_broadcasts:
+            self._pending_broadcasts[pin] = asyncio.create_task(self._flush_broadcast(pin))
+
+    async def _flush_broadcast(self, pin: str) -> None:
+        await asyncio.sleep(BROADCAST_COALESCE_SECONDS)
+        self._pending_broadcasts.pop(pin, None)
+        game = self.runtimes.get(pin)
+        if game:
+            await self._publish_state(game)
+
+    async def _publish_state(self, game: GameRuntime) -> None:
+        """
+        Рассылает текущую версию состояния, JSON кодируется один раз.
+
+        Для клиентов в режиме delta дополнительно один раз считается патч
+        относительно предыдущей разосланной версии.
+        """
+        pending = self._pending_broadcasts.pop(game.pin, None)
+        if pending and pending is not asyncio.current_task():
+            pending.cancel()
+        seq = self.state_versions[game.pin]
+        previous = self._last_broadcast.get(game.pin)
+        if previous and previous[0] == seq:
+            return
+        encoded, data = self._state_snapshot(game)
+        full_text = f'{{"type":"state","seq":{seq},"data":{encoded}}}'
+        patch_text = None
+        base_seq = 0
+        if previous:
+            base_seq = previous[0]
+            patch = _merge_patch(previous[1], data)
+            patch_text = _dump_json({"type": "patch", "seq": seq, "base": base_seq, "data": patch})
+        self._last_broadcast[game.pin] = (seq, data)
+        await self.manager.broadcast_state(game.pin, seq, full_text, patch_text, base_seq)
+
+    async def send_snapshot(self, db: Session, game: GameRuntime, websocket: WebSocket) -> None:
+        """Полный снимок одному сокету — после разрыва последовательности патчей."""
+        await self.manager.send_snapshot(game.pin, websocket, f'{{"type":"state","seq":0,"data":{self.state_json(db, game)}}}')
+
+    def _check_can_start(self, game: GameRuntime, host_player_id: int) -> None:
+        host = game.active_player(host_player_id)
         if not host or not host.is_host:
             raise HTTPException(status_code=403, detail="Только хост может начать игру")
         if game.status != "waiting":
             raise HTTPException(status_code=400, detail="Игра уже началась")
 
-        players = (
-            db.query(Player)
-            .filter(Player.game_id == game.id, Player.active.is_(True))
-            .all()
-        )
-        if len(players) < 2:
+    async def prepare_start(self, pin: str, host_player_id: int) -> GameRuntime:
+        """
+        Дожидается вопросов перед стартом — вне почтового ящика игры.
+
+        Генерация может идти до GENERATION_DEADLINE; ожидание в ящике
+        задержало бы все действия комнаты: входы, голоса, рассылки.
+        """
+        game = await self.load_game(pin)
+        self._check_can_start(game, host_player_id)
+        if not game.questions_ready:
+            await self._wait_questions(game)
+        return game
+
+    async def start_game(self, db: Session, pin: str, host_player_id: int) -> GameRuntime:
+        """Старт игры; вызывается через ящик после prepare_start."""
+        game = self.get_game(db, pin)
+        self._check_can_start(game, host_player_id)
+        if not game.questions_ready:
+            raise HTTPException(status_code=503, detail="Вопросы еще готовятся, попробуйте еще раз")
+
+        if len(game.active_players()) < 2:
             raise HTTPException(
                 status_code=400,
                 detail="Для старта нужен минимум 1 игрок в каждой команде",
             )
 
-        self._assign_teams_and_captains(db, game)
-        players = (
-            db.query(Player)
-            .filter(Player.game_id == game.id, Player.active.is_(True))
-            .all()
-        )
-        teams = Counter([p.team for p in players])
+        self._assign_teams_and_captains(game)
+        teams = Counter([p.team for p in game.active_players()])
         if teams.get("A", 0) == 0 or teams.get("B", 0) == 0:
             raise HTTPException(status_code=400, detail="Для старта нужен минимум 1 игрок в каждой команде")
 
@@ -279,67 +1014,72 @@ class GameService:
         game.current_team = "A"
         game.current_index_a = 0
         game.current_index_b = 0
-        db.commit()
-        db.refresh(game)
-
-        self.paused_remaining.pop(game.pin, None)
-        self.paused_elapsed.pop(game.pin, None)
-
-        for sec in [3, 2, 1]:
-            payload = self.to_state(db, game).model_dump()
-            payload["countdown_seconds"] = sec
-            await self.manager.broadcast(game.pin, {"type": "state", "data": payload})
-            await asyncio.sleep(1)
-
-        game.phase = "question"
-        game.question_started_at = datetime.now(timezone.utc)
-        db.commit()
-        db.refresh(game)
+        game.paused_remaining = None
+        game.paused_elapsed = None
+        game.phase_deadline = datetime.now(timezone.utc) + timedelta(seconds=COUNTDOWN_SECONDS)
         await self.broadcast_state(db, game)
-        await self.start_timer(game.pin, game.difficulty)
+        self._schedule_flush(game)
+        # Отсчет клиенты показывают сами по phase_deadline; вопрос откроет колесо таймеров.
+        self.timers.schedule(game.pin, COUNTDOWN_SECONDS, lambda: self.dispatch(game.pin, lambda: self._open_first_question(game.pin)))
         return game
 
-    async def start_timer(self, pin: str, difficulty: str, remaining_seconds: int | None = None) -> None:
-        existing = self.timer_tasks.get(pin)
-        if existing and not existing.done():
-            existing.cancel()
-
-        async def timer_coroutine() -> None:
-            try:
-                sleep_seconds = remaining_seconds if remaining_seconds is not None else BASE_QUESTION_TIMEOUT.get(difficulty, 30)
-                await asyncio.sleep(max(1, sleep_seconds))
-                local_db = SessionLocal()
-                try:
-                    game = self.get_game(local_db, pin)
-                    if game.status == "in_progress" and game.phase == "question":
-                        await self.process_answer(local_db, pin, player_id=None, option_index=None, timeout=True)
-                finally:
-                    local_db.close()
-            except asyncio.CancelledError:
-                return
-
-        self.timer_tasks[pin] = asyncio.create_task(timer_coroutine())
+    async def _open_first_question(self, pin: str) -> None:
+        game = self.runtimes.get(pin)
+        if not game or game.status != "in_progress" or game.phase != "countdown":
+            return
+        game.phase = "question"
+        game.phase_deadline = None
+        game.question_started_at = datetime.now(timezone.utc)
+        await self.broadcast_state(None, game)
+        self._schedule_flush(game)
+        self.start_timer(pin, game.difficulty)
+
+    def start_timer(self, pin: str, difficulty: str, remaining_seconds: int | None = None) -> None:
+        """Ставит дедлайн текущего вопроса в общее колесо таймеров."""
+        seconds = remaining_seconds if remaining_seconds is not None else BASE_QUESTION_TIMEOUT.get(difficulty, 30)
+        game = self.runtimes.get(pin)
+        question = game.current_question() if game else None
+        question_id = question.id if question else None
+        self.timers.schedule(pin, max(1, seconds), lambda: self.dispatch(pin, lambda: self._question_timeout(pin, question_id)))
+
+    async def _question_timeout(self, pin: str, question_id: int | None) -> None:
+        game = self.runtimes.get(pin)
+        question = game.current_question() if game else None
+        # Таймаут мог простоять в очереди за ответом капитана — тогда он уже устарел.
+        if question is not None and question.id == question_id:
+            await self.process_answer(None, pin, player_id=None, option_index=None, timeout=True)
 
     async def cast_vote(self, db: Session, pin: str, player_id: int, choice: str) -> None:
         game = self.get_game(db, pin)
         if game.status != "in_progress" or game.phase != "question":
             return
-        player = db.query(Player).filter(Player.id == player_id, Player.game_id == game.id, Player.active.is_(True)).first()
+        player = game.active_player(player_id)
         if not player or player.team != game.current_team:
             return
-        self.votes[pin][player_id] = choice
-        await self.broadcast_state(db, game)
+        previous = game.votes.get(player_id)
+        if previous == choice:
+            return
+        counter = game.vote_counts
+        if previous is not None:
+            counter[previous] -= 1
+            if counter[previous] <= 0:
+                del counter[previous]
+        counter[choice] = counter.get(choice, 0) + 1
+        game.votes[player_id] = choice
+        self.schedule_broadcast(pin)
 
     async def transfer_captain(self, db: Session, pin: str, from_player_id: int, to_player_id: int) -> None:
         game = self.get_game(db, pin)
-        frm = db.query(Player).filter(Player.id == from_player_id, Player.game_id == game.id).first()
-        to = db.query(Player).filter(Player.id == to_player_id, Player.game_id == game.id).first()
+        frm = game.players.get(from_player_id)
+        to = game.players.get(to_player_id)
         if not frm or not to or not frm.is_captain or frm.team != to.team:
             raise HTTPException(status_code=400, detail="Некорректная передача капитанства")
         frm.is_captain = False
         to.is_captain = True
-        db.commit()
+        game.mark_player(frm)
+        game.mark_player(to)
         await self.broadcast_state(db, game)
+        self._schedule_flush(game)
 
     async def process_answer(
         self,
@@ -354,11 +1094,11 @@ class GameService:
         game = self.get_game(db, pin)
         if game.status != "in_progress" or game.phase != "question":
             return
-        question = self.get_current_question(db, game)
+        question = game.current_question()
         if not question or question.answered:
             return
         if not timeout and not system_action:
-            player = db.query(Player).filter(Player.id == player_id, Player.game_id == game.id, Player.active.is_(True)).first()
+            player = game.active_player(player_id)
             if not player:
                 raise HTTPException(status_code=404, detail="Игрок не найден")
             if player.team != game.current_team:
@@ -368,26 +1108,28 @@ class GameService:
 
         is_correct = (not timeout and not skip and option_index == question.correct_option)
         question.answered = True
+        game.mark_question(question)
 
         elapsed = 0
         if game.question_started_at:
-            elapsed = max(0, int((datetime.now(timezone.utc) - game.question_started_at.replace(tzinfo=timezone.utc)).total_seconds()))
+            elapsed = max(0, int((datetime.now(timezone.utc) - game.question_started_at).total_seconds()))
 
         team_key = game.current_team
+        team_stats = game.team_stats[team_key]
         if timeout:
-            self.team_stats[pin][team_key]["timeout"] += 1
+            team_stats["timeout"] += 1
         elif skip:
-            self.team_stats[pin][team_key]["incorrect"] += 1
+            team_stats["incorrect"] += 1
         elif is_correct:
             bonus = 2 if elapsed <= 8 else 1 if elapsed <= 15 else 0
             if team_key == "A":
                 game.score_a += 1 + bonus
             else:
                 game.score_b += 1 + bonus
-            self.team_stats[pin][team_key]["correct"] += 1
-            self.team_stats[pin][team_key]["speed_bonus"] += bonus
+            team_stats["correct"] += 1
+            team_stats["speed_bonus"] += bonus
         else:
-            self.team_stats[pin][team_key]["incorrect"] += 1
+            team_stats["incorrect"] += 1
 
         if game.current_team == "A":
             game.current_index_a += 1
@@ -396,24 +1138,26 @@ class GameService:
             game.current_index_b += 1
             game.current_team = "A"
 
-        self.votes[pin] = {}
-        self.paused_remaining.pop(pin, None)
-        self.paused_elapsed.pop(pin, None)
+        self._reset_votes(game)
+        game.paused_remaining = None
+        game.paused_elapsed = None
 
         if game.current_index_a >= game.questions_per_team and game.current_index_b >= game.questions_per_team:
             game.status = "finished"
             game.phase = "results"
             game.current_team = None
+            self.pins.remove(pin, game.id)
         else:
             game.phase = "question"
             game.question_started_at = datetime.now(timezone.utc)
 
-        db.commit()
-        db.refresh(game)
         await self.manager.broadcast(pin, {"type": "answer_result", "data": {"timeout": timeout, "skip": skip, "correct": is_correct, "correct_option": question.correct_option, "team": question.team, "question_id": question.id}})
         await self.broadcast_state(db, game)
+        self._schedule_flush(game)
         if game.status == "in_progress":
-            await self.start_timer(pin, game.difficulty)
+            self.start_timer(pin, game.difficulty)
+        else:
+            self.timers.cancel(pin)
 
     async def host_control(
         self,
@@ -426,28 +1170,29 @@ class GameService:
         difficulty: str | None = None,
     ) -> None:
         game = self.get_game(db, pin)
-        host = db.query(Player).filter(Player.id == host_player_id, Player.game_id == game.id).first()
+        host = game.players.get(host_player_id)
         if not host or not host.is_host:
             raise HTTPException(status_code=403, detail="Только хост")
         if action == "pause":
             if game.status == "in_progress" and game.phase == "question":
                 elapsed = 0
                 if game.question_started_at:
-                    elapsed = max(0, int((datetime.now(timezone.utc) - game.question_started_at.replace(tzinfo=timezone.utc)).total_seconds()))
+                    elapsed = max(0, int((datetime.now(timezone.utc) - game.question_started_at).total_seconds()))
                 timeout_seconds = BASE_QUESTION_TIMEOUT.get(game.difficulty, 30)
-                self.paused_elapsed[pin] = elapsed
-                self.paused_remaining[pin] = max(1, timeout_seconds - elapsed)
+                game.paused_elapsed = elapsed
+                game.paused_remaining = max(1, timeout_seconds - elapsed)
                 game.phase = "paused"
-                task = self.timer_tasks.get(pin)
-                if task and not task.done():
-                    task.cancel()
+                self.timers.pause(pin)
         elif action == "resume":
             if game.status == "in_progress" and game.phase == "paused":
-                elapsed_before_pause = self.paused_elapsed.pop(pin, 0)
-                remaining_seconds = self.paused_remaining.pop(pin, None)
+                elapsed_before_pause = game.paused_elapsed or 0
+                remaining_seconds = game.paused_remaining
+                game.paused_elapsed = None
+                game.paused_remaining = None
                 game.phase = "question"
                 game.question_started_at = datetime.now(timezone.utc) - timedelta(seconds=elapsed_before_pause)
-                await self.start_timer(pin, game.difficulty, remaining_seconds=remaining_seconds)
+                if not self.timers.resume(pin):
+                    self.start_timer(pin, game.difficulty, remaining_seconds=remaining_seconds)
         elif action == "next_question":
             await self.process_answer(
                 db,
@@ -459,40 +1204,21 @@ class GameService:
             )
             return
         elif action == "kick" and target_player_id:
-            target = db.query(Player).filter(Player.id == target_player_id, Player.game_id == game.id).first()
+            target = game.players.get(target_player_id)
             if target:
                 target.active = False
+                game.dropped_players.discard(target.id)
+                game.mark_player(target)
         elif action == "restart":
             if game.status != "finished":
                 raise HTTPException(status_code=400, detail="Перезапуск доступен только после завершения игры")
-            if topic and topic.strip():
-                game.topic = topic.strip()
-            if difficulty in {"easy", "medium", "hard"}:
-                game.difficulty = difficulty
-
-            db.query(Question).filter(Question.game_id == game.id).delete()
-
-            # --- ОДИН ЗАПРОС ПРИ РЕСТАРТЕ ---
-            total_count = game.questions_per_team * 2
-            all_generated = generate_questions(game.topic, total_count, difficulty=game.difficulty)
-            random.shuffle(all_generated)
-
-            for i, q_data in enumerate(all_generated):
-                team_label = "A" if i < game.questions_per_team else "B"
-                order_idx = i if team_label == "A" else i - game.questions_per_team
-
-                db.add(Question(
-                    game_id=game.id,
-                    team=team_label,
-                    order_index=order_idx,
-                    text=q_data["text"],
-                    option_1=q_data["options"][0],
-                    option_2=q_data["options"][1],
-                    option_3=q_data["options"][2],
-                    option_4=q_data["options"][3],
-                    correct_option=q_data["correct_option"],
-                ))
+            if self.pins.game_id(pin) not in (None, game.id):
+                raise HTTPException(status_code=400, detail="Код этой игры уже занят новой комнатой")
+            new_topic = topic.strip() if topic and topic.strip() else game.topic
+            new_difficulty = difficulty if difficulty in {"easy", "medium", "hard"} else game.difficulty
 
+            game.topic = new_topic
+            game.difficulty = new_difficulty
             game.status = "waiting"
             game.phase = "gathering"
             game.current_team = None
@@ -501,36 +1227,59 @@ class GameService:
             game.score_a = 0
             game.score_b = 0
             game.question_started_at = None
-            self.votes[pin] = {}
-            self.team_stats[pin] = {
-                "A": {"correct": 0, "incorrect": 0, "timeout": 0, "speed_bonus": 0},
-                "B": {"correct": 0, "incorrect": 0, "timeout": 0, "speed_bonus": 0},
-            }
-            active_players = db.query(Player).filter(Player.game_id == game.id, Player.active.is_(True)).all()
-            for pl in active_players:
+            game.reset_round_state()
+            game.set_questions([])
+            self.pins.add(pin, game.id)
+            self._generate_questions(game)
+            for pl in game.active_players():
                 pl.team = None
                 pl.is_captain = False
-        db.commit()
+                game.mark_player(pl)
         await self.broadcast_state(db, game)
+        self._schedule_flush(game)
 
-    async def remove_player(self, db: Session, pin: str, player_id: int) -> None:
-        game = db.query(Game).filter(Game.pin == pin).first()
-        if not game:
+    def _remove_reaped_player(self, pin: str, player_id: int) -> None:
+        self.mailboxes.post(pin, lambda: self.remove_player(None, pin, player_id))
+
+    async def remove_player(self, db: Session | None, pin: str, player_id: int) -> None:
+        game = self.runtimes.get(pin)
+        if game is None:
             return
-        player = db.query(Player).filter(Player.id == player_id, Player.game_id == game.id).first()
+        player = game.players.get(player_id)
         if not player:
             return
         was_captain = player.is_captain
         team = player.team
+        if player.active:
+            game.dropped_players.add(player.id)
         player.active = False
         player.is_captain = False
-        db.commit()
+        game.mark_player(player)
         if was_captain and team:
-            replacement = db.query(Player).filter(Player.game_id == game.id, Player.team == team, Player.active.is_(True)).order_by(Player.joined_at.asc()).first()
+            replacement = next((p for p in game.active_players() if p.team == team), None)
             if replacement:
                 replacement.is_captain = True
-                db.commit()
+                game.mark_player(replacement)
         await self.broadcast_state(db, game)
+        self._schedule_flush(game)
+
+    async def reconnect_player(self, pin: str, player_id: int) -> None:
+        """
+        Подключение сокета игрока: снятый по обрыву соединения игрок возвращается в игру.
+
+        Капитанство возвращается, если у его команды капитана не осталось.
+        Выгнанные ведущим игроки не возвращаются.
+        """
+        game = self.get_game(None, pin)
+        player = game.players.get(player_id)
+        if player is not None and not player.active and player_id in game.dropped_players:
+            game.dropped_players.discard(player_id)
+            player.active = True
+            if player.team and not any(p.is_captain for p in game.active_players() if p.team == player.team):
+                player.is_captain = True
+            game.mark_player(player)
+            self._schedule_flush(game)
+        await self.broadcast_state(None, game)
 
     def get_user_stats(self, db: Session, user_id: int, username: str) -> UserProfileStatsResponse:
         player_rows = db.query(Player).filter(Player.user_id == user_id).all()
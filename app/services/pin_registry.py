@@ -0,0 +1,91 @@
+"""
+Индекс активных PIN и пул свободных кодов.
+
+PinRegistry знает PIN всех незавершенных игр процесса (загружается при
+старте, обновляется при создании, завершении и перезапуске игры), поэтому
+проверка занятости и поиск активной игры по PIN не ходят в БД.
+
+Свободные коды выдаются из заранее подготовленного пула. Пул пополняется
+пачкой: случайные кандидаты отсеиваются по индексу и одним запросом к БД
+среди незавершенных игр (уникальный индекс PIN частичный, поэтому код
+завершенной игры можно выдать снова). Если код все же
+оказался занят — другим воркером — create_game получает IntegrityError,
+отмечает коллизию и берет следующий код.
+"""
+
+import random
+import string
+from collections import Counter, deque
+
+from sqlalchemy.orm import Session
+
+from app.models import Game
+
+PIN_ALPHABET = string.ascii_uppercase + string.digits
+PIN_LENGTH = 6
+
+
+class PinRegistry:
+    def __init__(self, pool_size: int = 64) -> None:
+        self.pool_size = pool_size
+        self.active: dict[str, int] = {}
+        self._pool: deque[str] = deque()
+        self.counters: Counter = Counter()
+
+    def load(self, db: Session) -> None:
+        rows = db.query(Game.pin, Game.id).filter(Game.status != "finished").all()
+        self.active = {pin: game_id for pin, game_id in rows}
+        self._pool.clear()
+        self._refill(db)
+
+    def game_id(self, pin: str) -> int | None:
+        return self.active.get(pin)
+
+    def is_active(self, pin: str) -> bool:
+        return pin in self.active
+
+    def add(self, pin: str, game_id: int) -> None:
+        self.active[pin] = game_id
+
+    def remove(self, pin: str, game_id: int | None = None) -> None:
+        if game_id is None or self.active.get(pin) == game_id:
+            self.active.pop(pin, None)
+
+    def allocate(self, db: Session) -> str | None:
+        """Свободный PIN из пула (None, если подобрать не удалось); пул пополняется, когда в нем остается четверть."""
+        while True:
+            if len(self._pool) <= self.pool_size // 4:
+                self._refill(db)
+            if not self._pool:
+                return None
+            pin = self._pool.popleft()
+            if pin not in self.active:
+                self.counters["allocated"] += 1
+                return pin
+
+    def collision(self) -> None:
+        """PIN оказался занят в БД (например, другим воркером)."""
+        self.counters["collisions"] += 1
+
+    def _refill(self, db: Session) -> None:
+        needed = self.pool_size - len(self._pool)
+        if needed <= 0:
+            return
+        pooled = set(self._pool)
+        candidates: set[str] = set()
+        # Ограничиваем число попыток, чтобы не крутиться бесконечно при тесном пространстве PIN.
+        for _ in range(needed * 8):
+            if len(candidates) >= needed:
+                break
+            pin = "".join(random.choices(PIN_ALPHABET, k=PIN_LENGTH))
+            if pin not in self.active and pin not in pooled:
+                candidates.add(pin)
+        if candidates:
+            rows = db.query(Game.pin).filter(Game.pin.in_(candidates), Game.status != "finished").all()
+            taken = {pin for (pin,) in rows}
+            self.counters["rejected"] += len(taken)
+            self._pool.extend(candidates - taken)
+        self.counters["refills"] += 1
+
+    def stats(self) -> dict:
+        return {"active": len(self.active), "pool": len(self._pool), **self.counters}
@@ -0,0 +1,179 @@
+"""
+Пул заранее сгенерированных вопросов.
+
+Вопросы хранятся в таблице question_pool с ключом (нормализованная тема,
+сложность). create_game сначала берет вопросы из пула и только при промахе
+идет в AI. Фоновый пополнитель раз в QUIZBATTLE_POOL_REFILL_INTERVAL секунд
+выбирает самые популярные темы по истории игр и догенерирует вопросы до
+QUIZBATTLE_POOL_TARGET на ключ. Выданные вопросы из пула удаляются, чтобы
+не повторяться в следующих играх.
+"""
+
+import asyncio
+import os
+import time
+from collections import Counter
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.database import run_db
+from app.models import Game, PooledQuestion
+from app.services.ai_service import FALLBACK_QUESTIONS, generate_questions_async, get_timeweb_client, normalize_topic
+
+POOL_TARGET = int(os.getenv("QUIZBATTLE_POOL_TARGET", "40"))
+POOL_TOPICS = int(os.getenv("QUIZBATTLE_POOL_TOPICS", "10"))
+POOL_REFILL_INTERVAL = float(os.getenv("QUIZBATTLE_POOL_REFILL_INTERVAL", "300"))
+POOL_REFILL_BATCH = int(os.getenv("QUIZBATTLE_POOL_REFILL_BATCH", "20"))
+POOL_HISTORY_GAMES = 500
+
+_FALLBACK_TEXTS = {q["text"] for q in FALLBACK_QUESTIONS}
+
+
+class QuestionPool:
+    def __init__(self) -> None:
+        self.sizes: dict[tuple[str, str], int] = {}
+        self.counters: Counter = Counter()
+        self.refill_last = 0.0
+        self.refill_total = 0.0
+        self.refill_max = 0.0
+        self._task: asyncio.Task | None = None
+
+    def load(self, db: Session) -> None:
+        rows = (
+            db.query(PooledQuestion.topic_key, PooledQuestion.difficulty, func.count(PooledQuestion.id))
+            .group_by(PooledQuestion.topic_key, PooledQuestion.difficulty)
+            .all()
+        )
+        self.sizes = {(key, difficulty): count for key, difficulty, count in rows}
+
+    async def take(self, topic: str, difficulty: str, count: int) -> list[dict] | None:
+        """Забирает count вопросов из пула; None — промах. sizes меняется только в event loop."""
+        key = (normalize_topic(topic), difficulty)
+        if self.sizes.get(key, 0) < count:
+            self.counters["misses"] += 1
+            return None
+        questions, available = await run_db(self._take_rows, key[0], difficulty, count)
+        if available < count:
+            # Пул успел опустеть (например, его разобрал другой воркер).
+            self.sizes[key] = available
+            self.counters["misses"] += 1
+            return None
+        self.sizes[key] = self.sizes.get(key, 0) - len(questions)
+        self.counters["hits"] += 1
+        return questions
+
+    def _take_rows(self, db: Session, key: str, difficulty: str, count: int) -> tuple[list[dict], int]:
+        """Удаляет count вопросов одной транзакцией; возвращает их и сколько строк нашлось."""
+        rows = (
+            db.query(PooledQuestion)
+            .filter(PooledQuestion.topic_key == key, PooledQuestion.difficulty == difficulty)
+            .order_by(PooledQuestion.id)
+            .limit(count)
+            .all()
+        )
+        if len(rows) < count:
+            return [], len(rows)
+        questions = [
+            {
+                "text": row.text,
+                "options": [row.option_1, row.option_2, row.option_3, row.option_4],
+                "correct_option": row.correct_option,
+            }
+            for row in rows
+        ]
+        db.query(PooledQuestion).filter(PooledQuestion.id.in_([row.id for row in rows])).delete(
+            synchronize_session=False
+        )
+        db.commit()
+        return questions, len(rows)
+
+    def _popular_keys(self, db: Session) -> list[tuple[str, str, str]]:
+        """Популярные (ключ темы, сложность, исходная тема) по последним играм."""
+        rows = db.query(Game.topic, Game.difficulty).order_by(Game.id.desc()).limit(POOL_HISTORY_GAMES).all()
+        counts: Counter = Counter()
+        topics: dict[tuple[str, str], str] = {}
+        for topic, difficulty in rows:
+            key = (normalize_topic(topic), difficulty)
+            counts[key] += 1
+            topics.setdefault(key, topic)
+        return [(key, difficulty, topics[(key, difficulty)]) for (key, difficulty), _ in counts.most_common(POOL_TOPICS)]
+
+    def _pooled_texts(self, db: Session, key: str, difficulty: str) -> set[str]:
+        rows = db.query(PooledQuestion.text).filter(
+            PooledQuestion.topic_key == key, PooledQuestion.difficulty == difficulty
+        )
+        return {text for (text,) in rows}
+
+    def _store(self, db: Session, key: str, difficulty: str, questions: list[dict]) -> None:
+        db.add_all(
+            PooledQuestion(
+                topic_key=key,
+                difficulty=difficulty,
+                text=q["text"],
+                option_1=q["options"][0],
+                option_2=q["options"][1],
+                option_3=q["options"][2],
+                option_4=q["options"][3],
+                correct_option=q["correct_option"],
+            )
+            for q in questions
+        )
+        db.commit()
+
+    async def refill(self) -> int:
+        """Догенерирует вопросы для популярных тем; возвращает число добавленных."""
+        added = 0
+        for key, difficulty, topic in await run_db(self._popular_keys):
+            missing = POOL_TARGET - self.sizes.get((key, difficulty), 0)
+            if missing <= 0:
+                continue
+            started = time.perf_counter()
+            used = await run_db(self._pooled_texts, key, difficulty)
+            generated = await generate_questions_async(
+                topic, min(missing, POOL_REFILL_BATCH), used_texts=used, difficulty=difficulty
+            )
+            # Резервные вопросы в пул не кладем — это не ответ AI.
+            fresh = [q for q in generated if q["text"] not in _FALLBACK_TEXTS and q["text"] not in used]
+            if fresh:
+                await run_db(self._store, key, difficulty, fresh)
+                self.sizes[(key, difficulty)] = self.sizes.get((key, difficulty), 0) + len(fresh)
+                added += len(fresh)
+            self.refill_last = time.perf_counter() - started
+            self.refill_total += self.refill_last
+            self.refill_max = max(self.refill_max, self.refill_last)
+            self.counters["refills"] += 1
+            self.counters["generated"] += len(fresh)
+        return added
+
+    async def _refill_loop(self) -> None:
+        while True:
+            await asyncio.sleep(POOL_REFILL_INTERVAL)
+            if not get_timeweb_client().is_configured():
+                continue
+            try:
+                await self.refill()
+            except Exception as exc:
+                self.counters["refill_errors"] += 1
+                print(f"❌ Ошибка пополнения пула вопросов: {exc}")
+
+    def start(self) -> None:
+        if POOL_REFILL_INTERVAL > 0:
+            self._task = asyncio.create_task(self._refill_loop())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        hits, misses, refills = self.counters["hits"], self.counters["misses"], self.counters["refills"]
+        return {
+            "size": sum(self.sizes.values()),
+            "keys": sum(1 for size in self.sizes.values() if size > 0),
+            **self.counters,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+            "refill_ms_last": round(self.refill_last * 1000, 1),
+            "refill_ms_avg": round(self.refill_total / refills * 1000, 1) if refills else 0.0,
+            "refill_ms_max": round(self.refill_max * 1000, 1),
+        }
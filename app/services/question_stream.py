@@ -0,0 +1,84 @@
+"""
+Разбор ответа AI по мере поступления.
+
+QuestionArrayParser получает текст кусками (из SSE-потока или целиком)
+и отдает объекты массива вопросов, как только закрывается очередной
+объект. Обертки вокруг массива — ```json, {"data": [...]} — пропускаются.
+Битый объект пропускается, а не роняет весь ответ: уже разобранные
+вопросы остаются.
+"""
+
+import json
+from typing import Iterable, Iterator
+
+
+class QuestionArrayParser:
+    def __init__(self) -> None:
+        self._buffer: list[str] = []
+        self._in_array = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.malformed = 0
+
+    def feed(self, chunk: str) -> list[dict]:
+        """Добавляет кусок текста и возвращает объекты, которые в нем закончились."""
+        items: list[dict] = []
+        for char in chunk:
+            if not self._in_array:
+                # Массив вопросов — первая '[' ответа; до нее только обертка.
+                if char == "[":
+                    self._in_array = True
+                continue
+            if self._depth == 0:
+                if char == "{":
+                    self._depth = 1
+                    self._buffer = [char]
+                elif char == "]":
+                    self._in_array = False
+                continue
+            self._buffer.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    item = self._decode("".join(self._buffer))
+                    if item is not None:
+                        items.append(item)
+        return items
+
+    def _decode(self, text: str) -> dict | None:
+        try:
+            item = json.loads(text)
+        except ValueError:
+            self.malformed += 1
+            return None
+        return item if isinstance(item, dict) else None
+
+
+def iter_sse_content(lines: Iterable[str]) -> Iterator[str]:
+    """Текст ответа из строк SSE-потока chat/completions (stream=true)."""
+    for line in lines:
+        if not line or not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        try:
+            chunk = json.loads(data)
+        except ValueError:
+            continue
+        choices = chunk.get("choices") or [{}]
+        content = (choices[0].get("delta") or {}).get("content")
+        if content:
+            yield content
@@ -0,0 +1,191 @@
+"""
+Планировщик игровых таймеров.
+
+Все дедлайны вопросов и отсчеты всех игр живут в одном иерархическом
+колесе таймеров (hierarchical timing wheel) с одной корутиной-драйвером
+вместо отдельной asyncio-задачи на каждый вопрос. Постановка и отмена —
+O(1), пауза запоминает оставшееся время, возобновление ставит таймер заново.
+
+Шаг колеса задается QUIZBATTLE_TIMER_TICK_MS (по умолчанию 100 мс).
+Каждый уровень — 64 слота; четырех уровней хватает на сотни часов вперед.
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import Counter
+from typing import Awaitable, Callable
+
+TimerCallback = Callable[[], Awaitable[None]]
+
+WHEEL_BITS = 6
+WHEEL_SIZE = 1 << WHEEL_BITS
+WHEEL_MASK = WHEEL_SIZE - 1
+WHEEL_LEVELS = 4
+# Допуск на погрешность float: дедлайн ровно на границе шага не должен уезжать на шаг позже.
+TICK_EPSILON = 1e-9
+
+
+class TimerHandle:
+    __slots__ = ("key", "callback", "deadline", "expires", "level", "slot")
+
+    def __init__(self, key: str, callback: TimerCallback, deadline: float, expires: int) -> None:
+        self.key = key
+        self.callback = callback
+        self.deadline = deadline
+        self.expires = expires
+        self.level = 0
+        self.slot = 0
+
+
+class TimerWheel:
+    """
+    Один таймер на ключ (PIN игры): повторный schedule заменяет предыдущий.
+
+    Колбэк срабатывает не раньше дедлайна и не позже чем через шаг колеса
+    после него; фактическое опоздание копится в метриках lag.
+    """
+
+    def __init__(self, tick: float = 0.1) -> None:
+        self.tick = tick
+        self._levels: list[list[dict[TimerHandle, None]]] = [
+            [{} for _ in range(WHEEL_SIZE)] for _ in range(WHEEL_LEVELS)
+        ]
+        self._handles: dict[str, TimerHandle] = {}
+        self._paused: dict[str, tuple[float, TimerCallback]] = {}
+        self._current = 0
+        self._base = time.monotonic()
+        self._driver: asyncio.Task | None = None
+        self._running: set[asyncio.Task] = set()
+        self.counters: Counter = Counter()
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+
+    def _tick_at(self, moment: float) -> int:
+        return math.ceil((moment - self._base) / self.tick - TICK_EPSILON)
+
+    def _place(self, handle: TimerHandle) -> None:
+        delta = handle.expires - self._current
+        level = 0
+        while level < WHEEL_LEVELS - 1 and delta >= 1 << (WHEEL_BITS * (level + 1)):
+            level += 1
+        handle.level = level
+        handle.slot = (handle.expires >> (WHEEL_BITS * level)) & WHEEL_MASK
+        self._levels[level][handle.slot][handle] = None
+
+    def _unlink(self, handle: TimerHandle) -> None:
+        self._levels[handle.level][handle.slot].pop(handle, None)
+
+    def schedule(self, key: str, delay: float, callback: TimerCallback) -> None:
+        """Ставит таймер на delay секунд; прежний таймер и пауза ключа сбрасываются."""
+        self.cancel(key)
+        now = time.monotonic()
+        if not self._handles:
+            # Колесо простаивало: привязываем текущий шаг к настоящему времени.
+            self._base = now - self._current * self.tick
+        deadline = now + max(0.0, delay)
+        handle = TimerHandle(key, callback, deadline, max(self._current + 1, self._tick_at(deadline)))
+        self._place(handle)
+        self._handles[key] = handle
+        self.counters["scheduled"] += 1
+        if self._driver is None or self._driver.done():
+            self._driver = asyncio.create_task(self._run())
+
+    def cancel(self, key: str) -> bool:
+        self._paused.pop(key, None)
+        handle = self._handles.pop(key, None)
+        if handle is None:
+            return False
+        self._unlink(handle)
+        self.counters["cancelled"] += 1
+        return True
+
+    def remaining(self, key: str) -> float | None:
+        handle = self._handles.get(key)
+        if handle is None:
+            paused = self._paused.get(key)
+            return paused[0] if paused else None
+        return max(0.0, handle.deadline - time.monotonic())
+
+    def pause(self, key: str) -> float | None:
+        """Снимает таймер и запоминает остаток; возвращает остаток в секундах."""
+        handle = self._handles.get(key)
+        if handle is None:
+            return None
+        left = max(0.0, handle.deadline - time.monotonic())
+        self.cancel(key)
+        self._paused[key] = (left, handle.callback)
+        return left
+
+    def resume(self, key: str) -> bool:
+        """Ставит поставленный на паузу таймер на оставшееся время."""
+        paused = self._paused.pop(key, None)
+        if paused is None:
+            return False
+        self.schedule(key, paused[0], paused[1])
+        return True
+
+    def _advance(self) -> list[TimerHandle]:
+        self._current += 1
+        current = self._current
+        for level in range(WHEEL_LEVELS - 1, 0, -1):
+            if current & ((1 << (WHEEL_BITS * level)) - 1):
+                continue
+            slot = self._levels[level][(current >> (WHEEL_BITS * level)) & WHEEL_MASK]
+            handles = list(slot)
+            slot.clear()
+            for handle in handles:
+                self._place(handle)
+        slot = self._levels[0][current & WHEEL_MASK]
+        due = [handle for handle in slot if handle.expires <= current]
+        for handle in due:
+            del slot[handle]
+            del self._handles[handle.key]
+        return due
+
+    async def _run(self) -> None:
+        while self._handles:
+            target = self._base + (self._current + 1) * self.tick
+            await asyncio.sleep(max(0.0, target - time.monotonic()))
+            now = time.monotonic()
+            # Если цикл событий задержался, догоняем все пропущенные шаги.
+            while self._base + (self._current + 1) * self.tick <= now:
+                for handle in self._advance():
+                    self._fire(handle, now)
+
+    def _fire(self, handle: TimerHandle, now: float) -> None:
+        lag = max(0.0, now - handle.deadline)
+        self.counters["fired"] += 1
+        self.lag_total += lag
+        self.lag_max = max(self.lag_max, lag)
+        task = asyncio.create_task(handle.callback())
+        self._running.add(task)
+        task.add_done_callback(self._callback_done)
+
+    def _callback_done(self, task: asyncio.Task) -> None:
+        self._running.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.counters["callback_errors"] += 1
+            print(f"❌ Ошибка таймера: {task.exception()}")
+
+    async def stop(self) -> None:
+        if self._driver is not None:
+            self._driver.cancel()
+            self._driver = None
+
+    def stats(self) -> dict:
+        fired = self.counters["fired"]
+        return {
+            "tick_ms": int(self.tick * 1000),
+            "active": len(self._handles),
+            "paused": len(self._paused),
+            "running_callbacks": len(self._running),
+            **self.counters,
+            "lag_ms_avg": round(self.lag_total / fired * 1000, 1) if fired else 0.0,
+            "lag_ms_max": round(self.lag_max * 1000, 1),
+        }
+
+
+def create_timer_wheel() -> TimerWheel:
+    return TimerWheel(tick=int(os.getenv("QUIZBATTLE_TIMER_TICK_MS", "100")) / 1000)
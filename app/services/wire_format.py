@@ -0,0 +1,92 @@
+"""
+Форматы кадров игрового WebSocket.
+
+По умолчанию сервер шлет JSON-текст. Клиент может запросить подпротокол
+quizbattle.msgpack — тогда те же сообщения уходят бинарными кадрами
+MessagePack. Кодировщик покрывает типы, которые встречаются в сообщениях:
+None, bool, int, float, str, list и dict.
+"""
+
+import struct
+
+WIRE_JSON = "quizbattle.json"
+WIRE_MSGPACK = "quizbattle.msgpack"
+SUPPORTED_SUBPROTOCOLS = (WIRE_MSGPACK, WIRE_JSON)
+
+
+def negotiate_subprotocol(requested: list[str]) -> str | None:
+    """Выбирает подпротокол из предложенных клиентом; None — JSON без подпротокола."""
+    for name in requested:
+        if name in SUPPORTED_SUBPROTOCOLS:
+            return name
+    return None
+
+
+def _pack_int(value: int, out: bytearray) -> None:
+    if 0 <= value <= 0x7F:
+        out.append(value)
+    elif -32 <= value < 0:
+        out.append(value & 0xFF)
+    elif value >= 0:
+        if value <= 0xFF:
+            out += b"\xcc" + struct.pack(">B", value)
+        elif value <= 0xFFFF:
+            out += b"\xcd" + struct.pack(">H", value)
+        elif value <= 0xFFFFFFFF:
+            out += b"\xce" + struct.pack(">I", value)
+        else:
+            out += b"\xcf" + struct.pack(">Q", value)
+    elif value >= -0x80:
+        out += b"\xd0" + struct.pack(">b", value)
+    elif value >= -0x8000:
+        out += b"\xd1" + struct.pack(">h", value)
+    elif value >= -0x80000000:
+        out += b"\xd2" + struct.pack(">i", value)
+    else:
+        out += b"\xd3" + struct.pack(">q", value)
+
+
+def _pack_len(length: int, fix_tag: int, fix_max: int, tags: tuple[bytes, bytes, bytes], out: bytearray) -> None:
+    if length <= fix_max:
+        out.append(fix_tag | length)
+    elif tags[0] and length <= 0xFF:
+        out += tags[0] + struct.pack(">B", length)
+    elif length <= 0xFFFF:
+        out += tags[1] + struct.pack(">H", length)
+    else:
+        out += tags[2] + struct.pack(">I", length)
+
+
+def _pack(value, out: bytearray) -> None:
+    if value is None:
+        out.append(0xC0)
+    elif value is True:
+        out.append(0xC3)
+    elif value is False:
+        out.append(0xC2)
+    elif isinstance(value, int):
+        _pack_int(value, out)
+    elif isinstance(value, float):
+        out += b"\xcb" + struct.pack(">d", value)
+    elif isinstance(value, str):
+        raw = value.encode("utf-8")
+        _pack_len(len(raw), 0xA0, 31, (b"\xd9", b"\xda", b"\xdb"), out)
+        out += raw
+    elif isinstance(value, (list, tuple)):
+        _pack_len(len(value), 0x90, 15, (b"", b"\xdc", b"\xdd"), out)
+        for item in value:
+            _pack(item, out)
+    elif isinstance(value, dict):
+        _pack_len(len(value), 0x80, 15, (b"", b"\xde", b"\xdf"), out)
+        for key, item in value.items():
+            _pack(str(key), out)
+            _pack(item, out)
+    else:
+        raise TypeError(f"Тип {type(value).__name__} не поддерживается в MessagePack")
+
+
+def packb(value) -> bytes:
+    """Кодирует значение в MessagePack."""
+    out = bytearray()
+    _pack(value, out)
+    return bytes(out)
@@ -43,9 +43,13 @@ let ws;
 let currentQuestionId = null;
 let localTimer = null;
 let leftSeconds = 25;
+let countdownDeadline = null;
 let latestState = null;
 let restartPending = false;
 let previousPhase = null;
+let syncedState = null;
+let stateSeq = 0;
+let resyncRequested = false;
 
 const sounds = {
   wrongAnswer: new Audio('/sounds/wrong_answer.mp3'),
@@ -88,6 +92,35 @@ function wsUrl(path) {
   return `${proto}://${location.host}${path}`;
 }
 
+function applyMergePatch(target, patch) {
+  if (!patch || typeof patch !== 'object' || Array.isArray(patch)) return patch;
+  const result = target && typeof target === 'object' && !Array.isArray(target) ? { ...target } : {};
+  Object.entries(patch).forEach(([key, value]) => {
+    if (value === null) delete result[key];
+    else result[key] = applyMergePatch(result[key], value);
+  });
+  return result;
+}
+
+function applyStateMessage(msg) {
+  if (msg.type === 'state') {
+    syncedState = msg.data;
+    stateSeq = msg.seq || 0;
+    resyncRequested = false;
+    return syncedState;
+  }
+  if (!syncedState || msg.base !== stateSeq) {
+    if (!resyncRequested && ws && ws.readyState === WebSocket.OPEN) {
+      resyncRequested = true;
+      ws.send(JSON.stringify({ action: 'resync' }));
+    }
+    return null;
+  }
+  syncedState = applyMergePatch(syncedState, msg.data);
+  stateSeq = msg.seq;
+  return syncedState;
+}
+
 function sendHostControl(controlAction, targetPlayerId = null) {
   if (!ws || ws.readyState !== WebSocket.OPEN) return;
   ws.send(JSON.stringify({
@@ -100,7 +133,7 @@ function sendHostControl(controlAction, targetPlayerId = null) {
 function startCountdown(seconds) {
   clearInterval(localTimer);
   leftSeconds = seconds;
-  timerEl.textContent = `До старта: ${leftSeconds}`;
+  timerEl.textContent = leftSeconds > 0 ? `До старта: ${leftSeconds}` : 'Старт!';
   localTimer = setInterval(() => {
     leftSeconds -= 1;
     timerEl.textContent = leftSeconds > 0 ? `До старта: ${leftSeconds}` : 'Старт!';
@@ -351,7 +384,9 @@ function renderState(state) {
     captainControlsEl.classList.add('hidden');
     hostControlsEl.classList.add('hidden');
     turnEl.textContent = 'Период подключения: участники в лобби';
-    qText.textContent = `Здесь появится вопрос после начала игры`;
+    qText.textContent = state.questions_ready === false
+      ? 'Вопросы готовятся — можно собирать команды'
+      : `Здесь появится вопрос после начала игры`;
     answersEl.innerHTML = '';
     timerEl.textContent = '';
     currentQuestionId = null;
@@ -382,7 +417,11 @@ function renderState(state) {
     turnEl.textContent = 'Игра запускается...';
     qText.textContent = 'Приготовьтесь!';
     answersEl.innerHTML = '';
-    startCountdown(state.countdown_seconds || 3);
+    // Отсчет идет локально; перезапускаем его только при новом дедлайне с сервера.
+    if (countdownDeadline !== state.phase_deadline) {
+      countdownDeadline = state.phase_deadline;
+      startCountdown(state.countdown_seconds ?? 3);
+    }
   } else if (state.status === 'in_progress') {
     lobbySection.classList.add('hidden');
     teamSection.classList.remove('hidden');
@@ -499,12 +538,22 @@ restartBtn.addEventListener('click', () => {
 function connect() {
   if (!hasValidPlayer) return;
   const wsToken = encodeURIComponent(player.player_token || '');
-  ws = new WebSocket(wsUrl(`/ws/${pin}/${player.player_id}?token=${wsToken}`));
+  syncedState = null;
+  stateSeq = 0;
+  resyncRequested = false;
+  ws = new WebSocket(wsUrl(`/ws/${pin}/${player.player_id}?token=${wsToken}&proto=delta`), ['quizbattle.msgpack']);
+  ws.binaryType = 'arraybuffer';
   ws.onmessage = (event) => {
-    const msg = JSON.parse(event.data);
-    if (msg.type === 'state') {
-      restartBtn.disabled = false;
-      renderState(msg.data);
+    const msg = typeof event.data === 'string' ? JSON.parse(event.data) : decodeMsgpack(new Uint8Array(event.data));
+    if (msg.type === 'state' || msg.type === 'patch') {
+      const state = applyStateMessage(msg);
+      if (state) {
+        restartBtn.disabled = false;
+        renderState(state);
+      }
+    }
+    if (msg.type === 'ping' && ws.readyState === WebSocket.OPEN) {
+      ws.send(JSON.stringify({ action: 'pong' }));
     }
     if (msg.type === 'answer_result') {
       if (msg.data.timeout) resultEl.textContent = 'Время вышло';
@@ -513,8 +562,13 @@ function connect() {
       playAnswerResultSound(msg.data);
     }
   };
-  ws.onclose = () => {
+  ws.onclose = (event) => {
     restartBtn.disabled = false;
+    // 4001 — комната выгружена с сервера, 1008 — игрок не участвует в игре: переподключаться бессмысленно.
+    if (event.code === 4001 || event.code === 1008) {
+      resultEl.textContent = 'Комната закрыта';
+      return;
+    }
     if (restartPending) resultEl.textContent = 'Соединение перезапущено, проверьте состояние комнаты';
     setTimeout(connect, 2000);
   };
@@ -0,0 +1,74 @@
+// Декодер MessagePack для бинарных кадров подпротокола quizbattle.msgpack.
+// Поддерживает типы, которые шлет сервер: nil, bool, int, float, str, bin, array, map.
+function decodeMsgpack(bytes) {
+  const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+  const utf8 = new TextDecoder();
+  let pos = 0;
+
+  function str(length) {
+    const value = utf8.decode(bytes.subarray(pos, pos + length));
+    pos += length;
+    return value;
+  }
+
+  function bin(length) {
+    const value = bytes.slice(pos, pos + length);
+    pos += length;
+    return value;
+  }
+
+  function array(length) {
+    const value = new Array(length);
+    for (let i = 0; i < length; i += 1) value[i] = read();
+    return value;
+  }
+
+  function map(length) {
+    const value = {};
+    for (let i = 0; i < length; i += 1) {
+      const key = read();
+      value[key] = read();
+    }
+    return value;
+  }
+
+  function read() {
+    const tag = bytes[pos];
+    pos += 1;
+    if (tag <= 0x7f) return tag;
+    if (tag >= 0xe0) return tag - 0x100;
+    if ((tag & 0xe0) === 0xa0) return str(tag & 0x1f);
+    if ((tag & 0xf0) === 0x90) return array(tag & 0x0f);
+    if ((tag & 0xf0) === 0x80) return map(tag & 0x0f);
+
+    let value;
+    switch (tag) {
+      case 0xc0: return null;
+      case 0xc2: return false;
+      case 0xc3: return true;
+      case 0xc4: value = view.getUint8(pos); pos += 1; return bin(value);
+      case 0xc5: value = view.getUint16(pos); pos += 2; return bin(value);
+      case 0xc6: value = view.getUint32(pos); pos += 4; return bin(value);
+      case 0xca: value = view.getFloat32(pos); pos += 4; return value;
+      case 0xcb: value = view.getFloat64(pos); pos += 8; return value;
+      case 0xcc: value = view.getUint8(pos); pos += 1; return value;
+      case 0xcd: value = view.getUint16(pos); pos += 2; return value;
+      case 0xce: value = view.getUint32(pos); pos += 4; return value;
+      case 0xcf: value = Number(view.getBigUint64(pos)); pos += 8; return value;
+      case 0xd0: value = view.getInt8(pos); pos += 1; return value;
+      case 0xd1: value = view.getInt16(pos); pos += 2; return value;
+      case 0xd2: value = view.getInt32(pos); pos += 4; return value;
+      case 0xd3: value = Number(view.getBigInt64(pos)); pos += 8; return value;
+      case 0xd9: value = view.getUint8(pos); pos += 1; return str(value);
+      case 0xda: value = view.getUint16(pos); pos += 2; return str(value);
+      case 0xdb: value = view.getUint32(pos); pos += 4; return str(value);
+      case 0xdc: value = view.getUint16(pos); pos += 2; return array(value);
+      case 0xdd: value = view.getUint32(pos); pos += 4; return array(value);
+      case 0xde: value = view.getUint16(pos); pos += 2; return map(value);
+      case 0xdf: value = view.getUint32(pos); pos += 4; return map(value);
+      default: throw new Error(`MessagePack: неизвестный тип 0x${tag.toString(16)}`);
+    }
+  }
+
+  return read();
+}
@@ -0,0 +1,130 @@
+"""
+Замер генерации вопросов и создания комнат без выхода в сеть.
+
+Поднимает tools.mock_llm в этом же процессе и временную SQLite-базу,
+затем параллельно гоняет generate_questions_async (--mode generate) или
+GameService.create_game до готовности вопросов (--mode create) и печатает
+p50/p95/p99 времени до готовой комнаты и долю резервных вопросов:
+
+    python -m tools.bench_generation --mode create --rooms 100 --concurrency 20 \\
+        --topics 5 --latency 1.5 --jitter 0.5 --error-rate 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import urllib.request
+
+from tools.mock_llm import MockSettings, start_server
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _topic(args: argparse.Namespace, i: int) -> str:
+    return f"Тема {i % args.topics + 1}"
+
+
+async def bench_generate(args: argparse.Namespace) -> list[tuple[float, bool]]:
+    from app.services.ai_service import FALLBACK_QUESTIONS, generate_questions_async
+
+    fallback_texts = {q["text"] for q in FALLBACK_QUESTIONS}
+    limit = asyncio.Semaphore(args.concurrency)
+
+    async def one(i: int) -> tuple[float, bool]:
+        async with limit:
+            started = time.perf_counter()
+            questions = await generate_questions_async(_topic(args, i), args.questions * 2, difficulty=args.difficulty)
+            return time.perf_counter() - started, any(q["text"] in fallback_texts for q in questions)
+
+    return await asyncio.gather(*(one(i) for i in range(args.rooms)))
+
+
+async def bench_create(args: argparse.Namespace) -> list[tuple[float, bool]]:
+    from app.database import Base, engine
+    from app.services.ai_service import FALLBACK_QUESTIONS
+    from app.services.game_service import game_service
+
+    fallback_texts = {q["text"] for q in FALLBACK_QUESTIONS}
+    Base.metadata.create_all(bind=engine)
+    await game_service.start()
+    limit = asyncio.Semaphore(args.concurrency)
+    created: list[float] = []
+
+    async def one(i: int) -> tuple[float, bool]:
+        async with limit:
+            started = time.perf_counter()
+            game, _ = await game_service.create_game("bench", _topic(args, i), args.questions, None, args.difficulty)
+            created.append(time.perf_counter() - started)
+            await game.questions_task
+            return time.perf_counter() - started, any(q.text in fallback_texts for q in game.questions.values())
+
+    try:
+        results = await asyncio.gather(*(one(i) for i in range(args.rooms)))
+    finally:
+        await game_service.stop()
+    print(f"create_game (PIN выдан): p50 {percentile(created, 50) * 1000:.1f} мс, p99 {percentile(created, 99) * 1000:.1f} мс")
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк генерации вопросов на локальном mock LLM")
+    parser.add_argument("--mode", choices=("generate", "create"), default="create")
+    parser.add_argument("--rooms", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--topics", type=int, default=10, help="сколько разных тем среди комнат")
+    parser.add_argument("--questions", type=int, default=5, help="вопросов на команду")
+    parser.add_argument("--difficulty", default="medium")
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--stream", action="store_true", help="включить QUIZBATTLE_AI_STREAM")
+    args = parser.parse_args()
+
+    server = start_server(
+        MockSettings(args.latency, args.jitter, args.error_rate, args.malformed_rate)
+    )
+    # Настройки читаются при импорте app, поэтому задаем их до него; база — во временном каталоге.
+    os.chdir(tempfile.mkdtemp(prefix="quizbattle-bench-"))
+    os.environ.update(
+        TIMEWEB_API_KEY="mock",
+        TIMEWEB_API_BASE=f"http://127.0.0.1:{server.server_port}",
+        QUIZBATTLE_POOL_REFILL_INTERVAL="0",
+        QUIZBATTLE_AI_STREAM="1" if args.stream else "0",
+    )
+
+    started = time.perf_counter()
+    bench = bench_create if args.mode == "create" else bench_generate
+    results = asyncio.run(bench(args))
+    elapsed = time.perf_counter() - started
+    latencies = [latency for latency, _ in results]
+    fallbacks = sum(1 for _, fallback in results if fallback)
+    with urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}/") as response:
+        upstream = json.load(response)
+    server.shutdown()
+
+    from app.services.ai_service import get_timeweb_client, singleflight_stats
+
+    print(f"режим {args.mode}: {len(results)} комнат, параллельно {args.concurrency}, тем {args.topics}, за {elapsed:.2f} с")
+    print(
+        "время до готовой комнаты: "
+        + ", ".join(f"p{q} {percentile(latencies, q) * 1000:.0f} мс" for q in (50, 95, 99))
+        + f", max {max(latencies, default=0) * 1000:.0f} мс"
+    )
+    print(f"резервные вопросы: {fallbacks}/{len(results)} ({fallbacks / max(1, len(results)):.1%})")
+    print(f"mock LLM: {upstream}")
+    print(f"клиент AI: {get_timeweb_client().stats()}")
+    print(f"объединение запросов: {singleflight_stats()}")
+
+
+if __name__ == "__main__":
+    main()
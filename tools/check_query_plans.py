@@ -0,0 +1,79 @@
+"""
+Проверка планов горячих запросов по индексам схемы.
+
+Создает временную базу по моделям (create_all + upgrade_indexes), прогоняет
+EXPLAIN QUERY PLAN для запросов из загрузки игры, входа, выдачи PIN,
+восстановления и пула вопросов и завершается с кодом 1, если какой-то из
+них читает таблицу полным сканированием:
+
+    python -m tools.check_query_plans
+"""
+
+import os
+import re
+import sys
+import tempfile
+
+from sqlalchemy import create_engine, delete, func, select
+from sqlalchemy.engine import Engine
+
+from app.database import Base
+from app.migrations import upgrade_indexes
+from app.models import Game, Player, PooledQuestion, Question, QuestionSet
+
+# "SCAN players" без индекса; "SCAN ... USING INDEX" и "SEARCH" допустимы.
+FULL_SCAN = re.compile(r"\bSCAN (\w+)$")
+
+
+def hot_queries() -> dict[str, object]:
+    return {
+        "загрузка игры по PIN": select(Game).where(Game.pin == "ABC123").order_by(Game.id.desc()).limit(1),
+        "игроки комнаты": select(Player)
+        .where(Player.game_id == 1)
+        .order_by(Player.joined_at.asc(), Player.id.asc()),
+        "вопросы комнаты": select(Question).where(Question.game_id == 1),
+        "вопрос команды по порядку": select(Question).where(
+            Question.game_id == 1, Question.team == "A", Question.order_index == 0
+        ),
+        "очистка вопросов при перезапуске": delete(Question).where(Question.game_id == 1),
+        "компактный набор вопросов": select(QuestionSet).where(QuestionSet.game_id == 1),
+        "активные PIN при старте": select(Game.pin, Game.id).where(Game.status != "finished"),
+        "кандидаты PIN": select(Game.pin).where(Game.pin.in_(["ABC123", "XYZ789"]), Game.status != "finished"),
+        "восстановление идущих игр": select(Game).where(Game.status == "in_progress"),
+        "игры пользователя": select(Player).where(Player.user_id == 1),
+        "история игр": select(Game).where(Game.id.in_([1, 2, 3])).order_by(Game.created_at.desc()),
+        "сокомандники": select(Player).where(Player.game_id == 1, Player.id != 2, Player.team == "A"),
+        "размеры пула": select(PooledQuestion.topic_key, PooledQuestion.difficulty, func.count(PooledQuestion.id))
+        .group_by(PooledQuestion.topic_key, PooledQuestion.difficulty),
+        "выдача из пула": select(PooledQuestion)
+        .where(PooledQuestion.topic_key == "история", PooledQuestion.difficulty == "medium")
+        .order_by(PooledQuestion.id)
+        .limit(10),
+    }
+
+
+def query_plan(engine: Engine, statement) -> list[str]:
+    sql = str(statement.compile(engine, compile_kwargs={"literal_binds": True}))
+    with engine.connect() as conn:
+        return [row[3] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+
+
+def main() -> int:
+    path = os.path.join(tempfile.mkdtemp(prefix="quizbattle-plans-"), "plans.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    upgrade_indexes(engine)
+    failures = 0
+    for name, statement in hot_queries().items():
+        plan = query_plan(engine, statement)
+        scans = [line for line in plan if FULL_SCAN.search(line)]
+        failures += bool(scans)
+        print(f"{'❌' if scans else '✅'} {name}: {' | '.join(plan)}")
+    engine.dispose()
+    if failures:
+        print(f"Полное сканирование в {failures} запросах")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
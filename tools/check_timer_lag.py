@@ -0,0 +1,56 @@
+"""
+Проверка точности колеса таймеров.
+
+Ставит таймеры на разные задержки — и на границе шага, и между шагами,
+в том числе после отмены, когда колесо простаивает и привязывается к
+текущему времени заново (как при ответе на вопрос), — и завершается с
+кодом 1, если какой-то сработал позже чем через шаг после дедлайна:
+
+    python -m tools.check_timer_lag
+"""
+
+import asyncio
+import sys
+import time
+
+from app.services.timer_wheel import TimerWheel
+
+DELAYS = (0.05, 0.3, 0.35, 1.0, 1.23, 2.5)
+
+
+async def measure(wheel: TimerWheel, delay: float) -> float:
+    done = asyncio.get_running_loop().create_future()
+
+    async def fire() -> None:
+        done.set_result(time.monotonic())
+
+    # Пустой таймер и его отмена: следующий schedule начинается с простаивающего колеса.
+    wheel.schedule("check", 60, fire)
+    wheel.cancel("check")
+    deadline = time.monotonic() + delay
+    wheel.schedule("check", delay, fire)
+    return await done - deadline
+
+
+async def check() -> int:
+    wheel = TimerWheel()
+    failures = 0
+    for delay in DELAYS:
+        lag = await measure(wheel, delay)
+        late = lag >= wheel.tick
+        failures += late
+        print(f"{'❌' if late else '✅'} {delay} с: опоздание {lag * 1000:.1f} мс")
+    await wheel.stop()
+    stats = wheel.stats()
+    print(f"lag_ms_avg={stats['lag_ms_avg']} lag_ms_max={stats['lag_ms_max']} tick_ms={stats['tick_ms']}")
+    if failures:
+        print(f"Опоздание больше шага колеса: {failures}")
+    return 1 if failures else 0
+
+
+def main() -> int:
+    return asyncio.run(check())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""
+Локальная замена API /chat/completions для замеров и отладки без Timeweb.
+
+Отвечает массивом вопросов по количеству из промпта. Задержка, доля
+ошибок, доля битого JSON и потоковый режим настраиваются аргументами:
+
+    python -m tools.mock_llm --port 8099 --latency 2 --error-rate 0.1
+
+и переменные приложения:
+
+    TIMEWEB_API_KEY=mock TIMEWEB_API_BASE=http://127.0.0.1:8099
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+COUNT_PATTERN = re.compile(r"Сгенерируй (\d+)")
+
+
+class MockSettings:
+    def __init__(
+        self,
+        latency: float = 1.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        malformed_rate: float = 0.0,
+        stream_chunk: int = 40,
+        stream_delay: float = 0.01,
+    ) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.stream_chunk = stream_chunk
+        self.stream_delay = stream_delay
+        self.counters: Counter = Counter()
+        self.lock = threading.Lock()
+
+    def count(self, key: str) -> None:
+        with self.lock:
+            self.counters[key] += 1
+
+
+def _questions(count: int) -> list[dict]:
+    stamp = f"{time.time():.6f}"
+    return [
+        {
+            "text": f"Вопрос {i + 1} ({stamp})",
+            "options": [f"Вариант {j}" for j in range(1, 5)],
+            "correct_option": random.randint(1, 4),
+        }
+        for i in range(count)
+    ]
+
+
+def _content(count: int, malformed: bool) -> str:
+    text = json.dumps(_questions(count), ensure_ascii=False)
+    if malformed:
+        # Обрываем ответ посреди последнего вопроса, как при сбое модели.
+        text = text[: text.rfind("{") + 12]
+    return f"```json\n{text}\n```"
+
+
+def make_handler(settings: MockSettings) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self) -> None:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            settings.count("requests")
+            time.sleep(max(0.0, settings.latency + random.uniform(-settings.jitter, settings.jitter)))
+            if random.random() < settings.error_rate:
+                settings.count("errors")
+                self._send(500, b'{"error": "mock failure"}', "application/json")
+                return
+            prompt = body.get("messages", [{}])[0].get("content", "")
+            match = COUNT_PATTERN.search(prompt)
+            malformed = random.random() < settings.malformed_rate
+            if malformed:
+                settings.count("malformed")
+            content = _content(int(match.group(1)) if match else 5, malformed)
+            if body.get("stream"):
+                settings.count("streams")
+                self._stream(content)
+                return
+            payload = {"choices": [{"message": {"role": "assistant", "content": content}}]}
+            self._send(200, json.dumps(payload, ensure_ascii=False).encode(), "application/json")
+
+        def do_GET(self) -> None:
+            with settings.lock:
+                data = json.dumps(dict(settings.counters)).encode()
+            self._send(200, data, "application/json")
+
+        def _send(self, status: int, data: bytes, content_type: str) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _stream(self, content: str) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for start in range(0, len(content), settings.stream_chunk):
+                    delta = {"choices": [{"delta": {"content": content[start:start + settings.stream_chunk]}}]}
+                    self._chunk(f"data: {json.dumps(delta, ensure_ascii=False)}\n\n".encode())
+                    time.sleep(settings.stream_delay)
+                self._chunk(b"data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # Клиент набрал нужное число вопросов и закрыл поток.
+                settings.count("streams_closed_early")
+
+        def _chunk(self, data: bytes) -> None:
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        def log_message(self, *args) -> None:
+            pass
+
+    return Handler
+
+
+def start_server(settings: MockSettings, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Запускает сервер в фоновом потоке; port=0 — любой свободный (см. server.server_port)."""
+    server = ThreadingHTTPServer((host, port), make_handler(settings))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-llm", daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Локальный mock /chat/completions")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=1.0, help="задержка ответа, с")
+    parser.add_argument("--jitter", type=float, default=0.0, help="разброс задержки, ± с")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 500")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="доля оборванных JSON")
+    parser.add_argument("--stream-chunk", type=int, default=40, help="символов в одном SSE-событии")
+    parser.add_argument("--stream-delay", type=float, default=0.01, help="пауза между SSE-событиями, с")
+    args = parser.parse_args()
+    settings = MockSettings(
+        args.latency, args.jitter, args.error_rate, args.malformed_rate, args.stream_chunk, args.stream_delay
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(settings))
+    print(f"🤖 Mock LLM: http://{args.host}:{args.port} (GET / — счетчики)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()